@@ -0,0 +1,84 @@
+import random
+from datetime import date, timedelta
+
+from lxml import etree
+
+from pybsqr.bysquare import create_invoice_by_square, create_pay_by_square
+
+
+SIZES = {
+    # name: (free text length, number of tax summaries)
+    "small": (0, 1),
+    "medium": (40, 2),
+    "large": (140, 4),
+}
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do".split()
+
+
+def _text(rng: random.Random, length: int) -> str:
+    text = ""
+    while len(text) < length:
+        text += rng.choice(_WORDS) + " "
+    return text[:length].strip()
+
+
+def pay_kwargs(rng: random.Random, size: str) -> dict:
+    text_length, _ = SIZES[size]
+    return {
+        "invoice_number": str(rng.randrange(10**9)),
+        "amount": f"{rng.randrange(1, 10**6) / 100:.2f}",
+        "payment_due_date": date(2024, 1, 1) + timedelta(days=rng.randrange(365)),
+        "variable_symbol": str(rng.randrange(10**10)),
+        "constant_symbol": "0308",
+        "payment_note": _text(rng, text_length),
+        "bank_account_iban": "SK31%020d" % rng.randrange(10**20),
+        "bank_account_bic": "TATRSKBX",
+        "beneficiary_name": _text(rng, min(text_length, 70)),
+    }
+
+
+def invoice_kwargs(rng: random.Random, size: str) -> dict:
+    text_length, summaries = SIZES[size]
+    issue_date = date(2024, 1, 1) + timedelta(days=rng.randrange(365))
+    return {
+        "invoice_number": str(rng.randrange(10**9)),
+        "issue_date": issue_date,
+        "tax_date": issue_date,
+        "supplier_name": _text(rng, 20) or "Supplier",
+        "supplier_ico": str(rng.randrange(10**8)),
+        "supplier_dic": str(rng.randrange(10**10)),
+        "supplier_street": "Main",
+        "supplier_street_number": str(rng.randrange(1, 200)),
+        "supplier_city": "Bratislava",
+        "supplier_zip": "81101",
+        "customer_name": _text(rng, 20) or "Customer",
+        "invoice_item_count": 1 if size == "small" else rng.randrange(2, 50),
+        "invoice_item_text": "Item",
+        "invoice_description": _text(rng, min(text_length, 30)),
+        "tax_summaries": [
+            {
+                "tax_category": rng.choice(["0", "0.1", "0.2"]),
+                "price_ex_vat": f"{rng.randrange(1, 10**6) / 100:.2f}",
+                "vat_amount": f"{rng.randrange(1, 10**5) / 100:.2f}",
+            }
+            for _ in range(summaries)
+        ],
+    }
+
+
+def corpus(count: int, seed: int = 0) -> list[tuple[str, str, dict]]:
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        size = list(SIZES)[i % len(SIZES)]
+        if i % 2:
+            documents.append(("invoice", size, invoice_kwargs(rng, size)))
+        else:
+            documents.append(("pay", size, pay_kwargs(rng, size)))
+    return documents
+
+
+def to_xml(kind: str, kwargs: dict) -> bytes:
+    builder = create_pay_by_square if kind == "pay" else create_invoice_by_square
+    return etree.tostring(builder(**kwargs).xml)
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import pathlib
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+from lxml import objectify
+
+# Run from a checkout, the package is found next to the benchmarks
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Child interpreters of the startup and CLI stages import it from there too
+ENV = {
+    **os.environ,
+    "PYTHONPATH": os.pathsep.join(
+        filter(None, (str(ROOT), os.environ.get("PYTHONPATH")))
+    ),
+}
+
+from pybsqr import xml as pybsqr_xml
+from pybsqr.base import generate_code
+from pybsqr.bysquare import BUILDERS
+from pybsqr.qr import make_qr, qr_matrix
+from pybsqr.xml import get_generator, load_schema, makeparser
+
+from corpus import corpus, to_xml
+
+FRAMES = {"pay": "pay_by_square_frame", "invoice": "invoice_by_square_frame"}
+# Modules `pybsqr --code` has no use for and the budget of its start-up,
+# see "Startup time" in README.md. The import time is the median of
+# IMPORT_RUNS fresh interpreters, single runs vary by a third.
+DEFERRED_MODULES = ("qrcode", "PIL", "asyncio", "concurrent.futures", "pybsqr.batch")
+IMPORT_RUNS = 11
+IMPORT_BUDGET_US = 50_000
+CLI_CODE_BUDGET_US = 100_000
+# State of the qr_matrix cache each rendering stage is timed with. Renderers
+# get the matrix of their document from the cache, since fitting is timed by
+# qr_fit, while end-to-end runs fit every code again as before the cache.
+MATRIX_CACHE = {"plain_png": "warm", "framed_png": "warm", "create_end_to_end": "cold"}
+
+
+def _load_schema_cold():
+    pybsqr_xml._schema = None
+    load_schema()
+
+
+def _python(code: str):
+    subprocess.run([sys.executable, "-c", code], check=True, env=ENV)
+
+
+def import_profile() -> dict:
+    # Cumulative import time of pybsqr.cli as reported by -X importtime, and
+    # which of the deferred modules it pulled in anyway
+    check = (
+        "import json, sys, pybsqr.cli;"
+        f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+    )
+    runs = []
+    for _ in range(IMPORT_RUNS):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", check],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=ENV,
+        )
+        for line in process.stderr.splitlines():
+            if line.rstrip().endswith("| pybsqr.cli"):
+                runs.append(int(line.split("|")[1]))
+    return {
+        "import_us": statistics.median(runs),
+        "import_us_min": min(runs),
+        "import_us_max": max(runs),
+        "deferred_loaded": json.loads(process.stdout),
+    }
+
+
+def over_budget(results: dict) -> list[str]:
+    profile = results["meta"]["cli_import"]
+    problems = []
+    if profile["import_us"] > IMPORT_BUDGET_US:
+        problems.append(
+            f"import pybsqr.cli takes {profile['import_us']}us,"
+            f" the budget is {IMPORT_BUDGET_US}us"
+        )
+    if profile["deferred_loaded"]:
+        problems.append(f"import pybsqr.cli loads {profile['deferred_loaded']}")
+    cli_code = results["stages"].get("cli_code")
+    if cli_code is not None and cli_code["p50_us"] > CLI_CODE_BUDGET_US:
+        problems.append(
+            f"pybsqr --code takes {cli_code['p50_us']}us,"
+            f" the budget is {CLI_CODE_BUDGET_US}us"
+        )
+    return problems
+
+
+def _end_to_end(builder, kwargs: dict) -> bytes:
+    qr_matrix.cache_clear()
+    return builder(**kwargs).generate_qr().getvalue()
+
+
+def stages(documents: list, cli_count: int, tmp: str) -> tuple[dict, dict]:
+    # Calls of every stage, and the untimed setup calls of some
+    xmls = [(kind, to_xml(kind, kwargs)) for kind, _, kwargs in documents]
+    generators = [get_generator(xml) for _, xml in xmls]
+    fields = [(g.xml_to_fields(), g.bysquare_type) for g in generators]
+    codes = [generate_code(f, t) for f, t in fields]
+
+    def cli(path):
+        subprocess.run(
+            [sys.executable, "-c", "from pybsqr.cli import run; run()", "--code"]
+            + [path],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            env=ENV,
+        )
+
+    files = []
+    for i, (_, xml) in enumerate(xmls[:cli_count]):
+        files.append(f"{tmp}/{i}.xml")
+        with open(files[-1], "wb") as f:
+            f.write(xml)
+
+    # Keyed like the renderers call it, with the error correction given
+    warm = [lambda c=c: qr_matrix(c, "M") for c in codes]
+    setups = {name: warm for name, state in MATRIX_CACHE.items() if state == "warm"}
+    return {
+        "schema_load": [_load_schema_cold] * min(len(documents), 20),
+        "objectify_fromstring": [
+            lambda xml=xml: objectify.fromstring(xml, makeparser()) for _, xml in xmls
+        ],
+        "xml_to_fields": [g.xml_to_fields for g in generators],
+        "generate_code": [lambda f=f, t=t: generate_code(f, t) for f, t in fields],
+        "qr_fit": [lambda c=c: make_qr(c) for c in codes],
+        "plain_png": [
+            lambda g=g, c=c: g._generate_plain_png(c) for g, c in zip(generators, codes)
+        ],
+        "framed_png": [
+            lambda g=g, c=c, k=k: g._generate_framed_png(c, FRAMES[k])
+            for g, c, (k, _) in zip(generators, codes, xmls)
+        ],
+        "create_end_to_end": [
+            lambda k=k, kw=kw: _end_to_end(BUILDERS[k], kw) for k, _, kw in documents
+        ],
+        "python_startup": [lambda: _python("pass")] * cli_count,
+        "cli_import": [lambda: _python("import pybsqr.cli")] * cli_count,
+        "cli_code": [lambda p=p: cli(p) for p in files],
+    }, setups
+
+
+SINGLE_ROUND = ("schema_load", "python_startup", "cli_import", "cli_code")
+
+
+def measure(calls: list, rounds: int, setup: list | None = None) -> dict:
+    # setup holds an untimed call run before each of calls
+    for call in calls[:3]:
+        call()
+
+    latencies = []
+    untimed = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for i, call in enumerate(calls):
+            if setup:
+                t = time.perf_counter_ns()
+                setup[i]()
+                untimed += time.perf_counter_ns() - t
+            t = time.perf_counter_ns()
+            call()
+            latencies.append(time.perf_counter_ns() - t)
+    elapsed = time.perf_counter() - started - untimed / 1e9
+
+    tracemalloc.start()
+    for i, call in enumerate(calls[:50]):
+        if setup:
+            setup[i]()
+        call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "calls": len(latencies),
+        "ops_per_s": round(len(latencies) / elapsed, 1),
+        "mean_us": round(statistics.fmean(latencies) / 1000, 1),
+        "p50_us": round(quantiles[49] / 1000, 1),
+        "p95_us": round(quantiles[94] / 1000, 1),
+        "p99_us": round(quantiles[98] / 1000, 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(current: dict, baseline: dict):
+    print(f"{'stage':<22}{'p50 before':>14}{'p50 now':>12}{'ratio':>8}")
+    for name, result in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        ratio = result["p50_us"] / old["p50_us"] if old["p50_us"] else float("nan")
+        print(f"{name:<22}{old['p50_us']:>14}{result['p50_us']:>12}{ratio:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pybsqr pipeline benchmarks")
+    parser.add_argument("-n", "--documents", type=int, default=60)
+    parser.add_argument("-r", "--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cli", type=int, default=5, help="Documents for CLI runs")
+    parser.add_argument("--stage", action="append", help="Only run these stages")
+    parser.add_argument("-o", "--output", help="Save results as JSON")
+    parser.add_argument("--compare", help="Compare with previously saved results")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "versions": {
+                package: metadata.version(package)
+                for package in ("lxml", "qrcode", "pillow")
+            },
+            "documents": args.documents,
+            "rounds": args.rounds,
+            "seed": args.seed,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": {},
+    }
+
+    documents = corpus(args.documents, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        calls, setups = stages(documents, args.cli, tmp)
+        for name, stage_calls in calls.items():
+            if args.stage and name not in args.stage:
+                continue
+            rounds = 1 if name in SINGLE_ROUND else args.rounds
+            result = measure(stage_calls, rounds, setups.get(name))
+            cache = ""
+            if name in MATRIX_CACHE:
+                result["qr_matrix_cache"] = MATRIX_CACHE[name]
+                cache = f"  qr_matrix cache {MATRIX_CACHE[name]}"
+            results["stages"][name] = result
+            print(
+                f"{name:<22}{result['ops_per_s']:>10} ops/s"
+                f"  p50 {result['p50_us']}us  p95 {result['p95_us']}us"
+                f"  p99 {result['p99_us']}us  peak {result['peak_kib']}KiB{cache}",
+                flush=True,
+            )
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results["meta"]["cli_max_rss_kib"] = usage.ru_maxrss
+    profile = results["meta"]["cli_import"] = import_profile()
+    print(
+        f"{'pybsqr.cli import':<22}{profile['import_us']}us median of"
+        f" {IMPORT_RUNS} ({profile['import_us_min']}-{profile['import_us_max']}us)"
+        f"  deferred modules loaded: {profile['deferred_loaded'] or 'none'}"
+    )
+    problems = over_budget(results)
+    for problem in problems:
+        print(f"over budget: {problem}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
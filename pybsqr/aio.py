@@ -0,0 +1,51 @@
+import functools
+import weakref
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+
+# asyncio is only imported once a coroutine runs, synchronous callers of the
+# modules that offer async variants do not pay for it
+_executor: "Executor | None" = None
+_max_concurrency: int | None = None
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def configure(executor: "Executor | None" = None, max_concurrency: int | None = None):
+    # executor=None uses the event loop's default thread pool. Process pools
+    # work as well, as long as the generators involved are picklable (that is
+    # built without validate=True).
+    global _executor, _max_concurrency
+    _executor = executor
+    _max_concurrency = max_concurrency
+    _semaphores.clear()
+
+
+def _semaphore() -> "asyncio.Semaphore | None":
+    import asyncio
+
+    if _max_concurrency is None:
+        return None
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(_max_concurrency)
+    return semaphore
+
+
+async def run(func, *args, **kwargs):
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    semaphore = _semaphore()
+    if semaphore is None:
+        return await loop.run_in_executor(_executor, call)
+    # Work is only submitted once a slot is free, so a coroutine cancelled
+    # while waiting never reaches the executor, and cancelling one that is
+    # queued in the executor cancels its pending future too
+    async with semaphore:
+        return await loop.run_in_executor(_executor, call)
@@ -1,95 +1,582 @@
 import base64
 import binascii
+import contextlib
+import functools
 import io
 import lzma
-import pathlib
+import os
+import re
+import zlib
+from typing import IO
 
-from qrcode import QRCode
+from . import aio, instrument, layout
+from .cache import get_cache, make_key
+from .instrument import instrumented
+from .qr import ERROR_CORRECTION, QRMatrix, qr_matrix
+
+
+_DARK_RUN = re.compile(b"\x01+")
+
+FORMATS = {
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "BMP": "image/bmp",
+    "SVG": "image/svg+xml",
+}
+
+
+def encode_payload(fields: list[str], type_: int) -> bytes:
+    fields_joined = "\t".join(map(lambda x: x.replace("\t", " "), map(str, fields)))
+
+    checksum = binascii.crc32(fields_joined.encode()).to_bytes(4, "little")
+    final_string = checksum + fields_joined.encode()
+
+    compressed = lzma.compress(
+        final_string,
+        format=lzma.FORMAT_RAW,
+        filters=[
+            {"id": lzma.FILTER_LZMA1, "lc": 3, "lp": 0, "pb": 2, "dict_size": 2**17}
+        ],
+    )
+    return bytes((type_, 0x00)) + len(final_string).to_bytes(2, "little") + compressed
+
+
+def code_length(payload: bytes) -> int:
+    # base32hex without padding, five bits per character
+    return (len(payload) * 8 + 4) // 5
+
+
+@instrumented("generate_code")
+def generate_code(fields: list[str], type_: int) -> str:
+    compressed_with_len = encode_payload(fields, type_)
+
+    code = base64.b32hexencode(compressed_with_len).decode().strip("=")
+
+    if instrument.enabled:
+        instrument.note(
+            fields_bytes=int.from_bytes(compressed_with_len[2:4], "little"),
+            compressed_bytes=len(compressed_with_len),
+            code_length=len(code),
+        )
+    return code
+
+
+@functools.cache
+def _load_frame(frame: str):
+    from PIL import Image
+
+    frame_img = Image.open(
+        os.path.join(os.path.dirname(__file__), f"frames/{frame}.png")
+    )
+    frame_img.load()
+    return frame_img
+
+
+@functools.lru_cache(maxsize=32)
+def _scaled_frame(frame: str, width: int):
+    from PIL import Image
+
+    frame_img = _load_frame(frame)
+    frame_img = frame_img.resize(
+        (width, round(width * frame_img.height / frame_img.width))
+    )
+    white_bg = Image.new("RGBA", frame_img.size, "WHITE")
+    return Image.alpha_composite(white_bg, frame_img)
+
+
+@functools.lru_cache(maxsize=32)
+def _palette_frame(frame: str, width: int, colors: int):
+    from PIL import Image
+
+    rgb = _scaled_frame(frame, width).convert("RGB")
+    img = rgb.quantize(colors - 1, dither=Image.Dither.NONE)
+    palette = img.getpalette()[: 3 * (colors - 1)]
+    # All white pixels share one palette entry, which is made exactly white
+    # for the light modules, and black is added for the dark ones
+    data = rgb.tobytes()
+    offset = data.find(b"\xff\xff\xff")
+    while offset >= 0 and offset % 3:
+        offset = data.find(b"\xff\xff\xff", offset + 1)
+    if offset >= 0:
+        white = img.getpixel((offset // 3 % rgb.width, offset // 3 // rgb.width))
+        palette[3 * white : 3 * white + 3] = (255, 255, 255)
+    img.putpalette(palette + [0, 0, 0])
+    return img, len(palette) // 3
+
+
+@functools.cache
+def _load_svg_frame(frame: str) -> tuple[str, str, float]:
+    with open(os.path.join(os.path.dirname(__file__), f"frames/{frame}.svg")) as f:
+        svg = f.read()
+    head_end = svg.index(">", svg.index("<svg")) + 1
+    tail_start = svg.rindex("</svg>")
+    # The QR fills the top square of the frame, as wide as its viewBox
+    width = float(re.search(r'viewBox="([^"]*)"', svg).group(1).split()[2])
+    return svg[:head_end], svg[head_end:tail_start], width
+
+
+def _box_size(matrix: QRMatrix, border: int, size: int) -> int:
+    # Whole pixels per module, as many as fit into size
+    box_size = size // (matrix.size + 2 * border)
+    if box_size < 1:
+        raise ValueError(f"{size} pixels cannot fit {matrix.size + 2 * border} modules")
+    return box_size
+
+
+@functools.lru_cache(maxsize=64)
+def _scaled_bytes(box_size: int) -> list[bytes]:
+    # Pixels of every byte of 8 modules, which are exactly box_size bytes
+    scale = str.maketrans({"0": "0" * box_size, "1": "1" * box_size})
+    return [
+        int(f"{byte:08b}".translate(scale), 2).to_bytes(box_size, "big")
+        for byte in range(256)
+    ]
+
+
+def _module_rows(
+    matrix: QRMatrix,
+    box_size: int,
+    border: int,
+    size: int | None = None,
+    mask: bool = False,
+) -> tuple[int, list[tuple[bytes, int]]]:
+    # Scales the module matrix to packed 1-bit rows a byte of modules at a
+    # time, given as (row, repeat) pairs. Dark pixels are 0 bits like in PNG,
+    # or 1 bits for a mask. Pixels left over by whole modules widen the quiet
+    # zone.
+    if size is None:
+        size = (matrix.size + 2 * border) * box_size
+    else:
+        box_size = _box_size(matrix, border, size)
+    before = (size - matrix.size * box_size) // 2
+    after = size - matrix.size * box_size - before
+    row_bytes = (size + 7) // 8
+    pad = (matrix.row_bytes * 8 - matrix.size) * box_size
+    right = after + row_bytes * 8 - size
+    invert = 0 if mask else 2 ** (row_bytes * 8) - 1
+    blank = invert.to_bytes(row_bytes, "big")
+    pixels = b"".join(map(_scaled_bytes(box_size).__getitem__, matrix.data))
+    step = matrix.row_bytes * box_size
+    rows = [(blank, before)]
+    for start in range(0, len(pixels), step):
+        value = int.from_bytes(pixels[start : start + step], "big")
+        value = (value >> pad << right) ^ invert
+        rows.append((value.to_bytes(row_bytes, "big"), box_size))
+    rows.append((blank, after))
+    return size, rows
+
+
+def _module_image(
+    matrix: QRMatrix,
+    box_size: int,
+    border: int,
+    size: int | None = None,
+    mask: bool = False,
+):
+    from PIL import Image
+
+    size, rows = _module_rows(matrix, box_size, border, size, mask)
+    data = b"".join([row * repeat for row, repeat in rows])
+    return Image.frombytes("1", (size, size), data)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    checksum = zlib.crc32(tag + data).to_bytes(4, "big")
+    return len(data).to_bytes(4, "big") + tag + data + checksum
+
+
+def _write_png(out: IO[bytes], size: int, rows: list, compress_level=None):
+    # 1-bit grayscale, so no Pillow is needed. Repeats of a row use the Up
+    # filter, which turns them into zeros that deflate quickly.
+    header = size.to_bytes(4, "big") * 2 + bytes((1, 0, 0, 0, 0))
+    up = b"\x02" + bytes((size + 7) // 8)
+    data = zlib.compress(
+        b"".join([b"\x00" + row + up * (repeat - 1) for row, repeat in rows if repeat]),
+        -1 if compress_level is None else compress_level,
+    )
+    out.write(
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", data)
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def _save_raster(img, out: IO[bytes], format: str, compress_level: int | None):
+    params = {}
+    if format == "WEBP":
+        # Lossless keeps modules sharp, the level selects the encoder effort
+        params["lossless"] = True
+        if compress_level is not None:
+            params["method"] = compress_level
+    elif format == "PNG" and compress_level is not None:
+        params["compress_level"] = compress_level
+    img.save(out, format=format, **params)
+
+
+def compile_layout(items: tuple) -> tuple:
+    # Pairs every layout item with its namespace qualified tag, once per class
+    return tuple(
+        (
+            f"{{{layout.NS}}}{item.tag}",
+            item,
+            None if isinstance(item, layout.Field) else compile_layout(item.layout),
+        )
+        for item in items
+    )
+
+
+def _extract(plan: tuple, element, fields: list[str]):
+    # Walks the children of element once, then emits fields in layout order.
+    # Missing elements, or a missing element itself, give empty fields.
+    children = {}
+    if element is not None:
+        for child in element.iterchildren():
+            children.setdefault(child.tag, child)
+    for tag, item, items in plan:
+        child = children.get(tag)
+        if items is None:
+            text = child.text if child is not None else None
+            if not text:
+                fields.append("")
+            elif item.flags is not None:
+                fields.append(str(sum(item.flags[flag] for flag in set(text.split()))))
+            elif item.date:
+                fields.append(text.replace("-", ""))
+            else:
+                fields.append(text)
+        elif isinstance(item, layout.Group):
+            _extract(items, child, fields)
+        elif isinstance(item, layout.Repeated):
+            repeated = (
+                list(child.iterchildren(f"{{{layout.NS}}}{item.item}"))
+                if child is not None
+                else []
+            )
+            fields.append(str(len(repeated)))
+            for element in repeated:
+                _extract(items, element, fields)
+        else:
+            # TODO: StandingOrderExt and DirectDebitExt are not encoded yet
+            fields.append("0")
+
+
+class _Sink:
+    # Counts what is written through it. Has no fileno(), so Pillow writes
+    # its encoded chunks here instead of flushing to the descriptor itself.
+
+    def __init__(self, write):
+        self._write = write
+        self.written = 0
+
+    def write(self, data) -> int:
+        written = self._write(data)
+        if written is None:
+            written = len(data)
+        self.written += written
+        return written
+
+    def flush(self):
+        pass
+
+
+def _buffer_writer(buffer):
+    view = memoryview(buffer).cast("B")
+    offset = 0
+
+    def write(data) -> int:
+        nonlocal offset
+        end = offset + len(data)
+        if end > len(view):
+            raise ValueError(f"Output buffer of {len(view)} bytes is too small")
+        view[offset:end] = data
+        offset = end
+        return len(data)
+
+    return write
+
+
+@contextlib.contextmanager
+def _open_output(output):
+    if isinstance(output, int):
+        with os.fdopen(output, "wb", closefd=False) as f:
+            yield _Sink(f.write)
+    elif isinstance(output, (str, os.PathLike)):
+        with open(output, "wb") as f:
+            yield _Sink(f.write)
+    elif hasattr(output, "write"):
+        yield _Sink(output.write)
+    else:
+        yield _Sink(_buffer_writer(output))
+
+
+def _render_qr(cls: type["BySquare"], code: str, **kwargs) -> io.BytesIO:
+    # Renders on a fresh instance so only the class and code need to be sent
+    # to a process pool worker
+    return cls().generate_qr(code, **kwargs)
 
 
 class BySquare:
 
-    def __init__(self, xml=None):
+    bysquare_type: int
+    # Compiled layout table of the document type, see compile_layout()
+    plan: tuple = ()
+
+    def __init__(self, xml=None, fields=None, xml_factory=None):
         self._xml = xml
-        self._fields = None
+        self._xml_factory = xml_factory
+        self._fields = fields
         self._code = None
 
     @property
     def xml(self):
+        if self._xml is None and self._xml_factory is not None:
+            self._xml = self._xml_factory()
         return self._xml
 
     @property
     def fields(self):
-        return self._fields or self.xml_to_fields()
+        if self._fields is None:
+            return self.xml_to_fields()
+        return self._fields
 
     @property
     def code(self):
-        return self._code or self.generate_code()
+        if self._code is None:
+            return self.generate_code()
+        return self._code
 
-    def _generate_code(self, fields: list[str], type_: int) -> str:
-        fields_joined = "\t".join(map(lambda x: x.replace("\t", " "), map(str, fields)))
+    @instrumented("xml_to_fields")
+    def xml_to_fields(self, xml=None) -> list[str]:
+        if xml is None:
+            xml = self.xml
 
-        checksum = binascii.crc32(fields_joined.encode()).to_bytes(4, "little")
-        final_string = checksum + fields_joined.encode()
+        fields = []
+        _extract(self.plan, xml, fields)
 
-        compressed = lzma.compress(
-            final_string,
-            format=lzma.FORMAT_RAW,
-            filters=[
-                {"id": lzma.FILTER_LZMA1, "lc": 3, "lp": 0, "pb": 2, "dict_size": 2**17}
-            ],
-        )
-        compressed_with_len = (
-            bytes((type_, 0x00)) + len(final_string).to_bytes(2, "little") + compressed
-        )
+        self._fields = fields
+
+        return fields
+
+    def _generate_code(self, fields: list[str], type_: int) -> str:
+        cache = get_cache()
+        if cache is None:
+            return generate_code(fields, type_)
+        key = make_key("code", type_, list(map(str, fields)))
+        code = cache.get(key)
+        if code is None:
+            code = generate_code(fields, type_).encode()
+            cache.set(key, code)
+        return code.decode()
 
-        code = base64.b32hexencode(compressed_with_len).decode().strip("=")
+    def _extract_code(self, fields: list[str] | None) -> tuple[list[str], str]:
+        if fields is None:
+            fields = self.fields
+        return fields, self._generate_code(fields, self.bysquare_type)
 
+    async def agenerate_code(self, fields: list[str] | None = None) -> str:
+        # Extracting the fields walks the lxml tree, so it runs in the
+        # executor together with the code generation, not on the event loop
+        fields, code = await aio.run(self._extract_code, fields)
+
+        self._fields = fields
+        self._code = code
         return code
 
-    def _generate_plain_png(self, code: str) -> io.BytesIO:
-        buf = io.BytesIO()
-        qr = QRCode()
-        qr.add_data(code)
-        img = qr.make_image()
-        img.save(buf)
-        buf.seek(0)
+    async def agenerate_qr(self, code: str | None = None, **kwargs) -> io.BytesIO:
+        if code is None:
+            code = self._code or await self.agenerate_code()
+        return await aio.run(_render_qr, type(self), code, **kwargs)
+
+    def qr_matrix(
+        self, code: str | None = None, error_correction: str = "M"
+    ) -> QRMatrix:
+        if code is None:
+            code = self.code
+        return qr_matrix(code, error_correction)
+
+    @instrumented("generate_plain_png")
+    def _generate_plain_png(
+        self,
+        code: str,
+        error_correction: str = "M",
+        box_size: int = 10,
+        border: int = 4,
+        out: IO[bytes] | None = None,
+        format: str = "PNG",
+        size: int | None = None,
+        colors: int | None = None,
+        compress_level: int | None = None,
+    ) -> IO[bytes]:
+        # Plain images are black and white, so always 1-bit whatever colors is
+        buf = io.BytesIO() if out is None else out
+        matrix = qr_matrix(code, error_correction)
+        if instrument.enabled:
+            instrument.note(qr_version=matrix.version)
+        if format == "PNG":
+            size, rows = _module_rows(matrix, box_size, border, size)
+            _write_png(buf, size, rows, compress_level)
+        else:
+            img = _module_image(matrix, box_size, border, size)
+            _save_raster(img, buf, format, compress_level)
+        if out is None:
+            buf.seek(0)
         return buf
 
-    def _generate_framed_png(self, code: str, frame: str) -> io.BytesIO:
-        from PIL import Image
-        from qrcode.image.pil import PilImage
+    @instrumented("generate_framed_png")
+    def _generate_framed_png(
+        self,
+        code: str,
+        frame: str,
+        error_correction: str = "M",
+        box_size: int = 10,
+        border: int = 4,
+        out: IO[bytes] | None = None,
+        format: str = "PNG",
+        size: int | None = None,
+        colors: int | None = None,
+        compress_level: int | None = None,
+    ) -> IO[bytes]:
+        # colors gives a palette image of that many colors instead of a true
+        # color one, with the frame quantized once per size
+        buf = io.BytesIO() if out is None else out
+
+        matrix = qr_matrix(code, error_correction)
+        if instrument.enabled:
+            instrument.note(qr_version=matrix.version)
+        modules = _module_image(matrix, box_size, border, size, mask=True)
+        if colors is None:
+            frame_img = _scaled_frame(frame, modules.height).copy()
+            black = (0, 0, 0, 255)
+            if format != "PNG":
+                frame_img = frame_img.convert("RGB")
+                black = black[:3]
+        else:
+            # White, black and at least one color of the frame
+            if not 3 <= colors <= 256:
+                raise ValueError(f"colors must be between 3 and 256, not {colors}")
+            frame_img, black = _palette_frame(frame, modules.height, colors)
+            frame_img = frame_img.copy()
+        # Modules are opaque black, so painting them through a mask of the
+        # dark modules equals alpha-compositing the QR onto the white frame
+        frame_img.paste(black, (0, 0, modules.width, modules.height), modules)
+        _save_raster(frame_img, buf, format, compress_level)
+        if out is None:
+            buf.seek(0)
 
-        buf = io.BytesIO()
+        return buf
+
+    @instrumented("generate_svg")
+    def _generate_svg(
+        self,
+        code: str,
+        frame: str | None = None,
+        error_correction: str = "M",
+        box_size: int = 10,
+        border: int = 4,
+        out: IO[bytes] | None = None,
+    ) -> IO[bytes]:
+        matrix = qr_matrix(code, error_correction)
+        if instrument.enabled:
+            instrument.note(qr_version=matrix.version)
+        size = matrix.size + 2 * border
 
-        frame_img = Image.open(pathlib.Path(__file__).parent / f"frames/{frame}.png")
-        qr = QRCode(image_factory=PilImage)
-        qr.add_data(code)
-        qr = qr.make_image(back_color="transparent")
-        frame_img = frame_img.resize(
-            (qr.height, round(qr.height * frame_img.height / frame_img.width))
+        path = "".join(
+            f"M{match.start()},{y}h{match.end() - match.start()}v1h"
+            f"-{match.end() - match.start()}z"
+            for y, row in enumerate(matrix.rows(border))
+            for match in _DARK_RUN.finditer(row)
         )
-        qr = qr.convert("RGBA")
-        qr.putdata(
-            list(
-                map(
-                    lambda d: [255, 255, 255, 0] if d[:3] == [255, 255, 255] else d,
-                    qr.getdata(),
-                )
+        modules = f'<path d="{path}" fill="#000000" shape-rendering="crispEdges"{{}}/>'
+
+        if frame is None:
+            pixels = size * box_size
+            svg = (
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}"'
+                f' height="{pixels}" viewBox="0 0 {size} {size}">'
+                f'<rect width="{size}" height="{size}" fill="#ffffff"/>'
+                f'{modules.format("")}</svg>\n'
+            )
+        else:
+            head, body, width = _load_svg_frame(frame)
+            transform = f' transform="scale({width / size:.6g})"'
+            svg = (
+                f'{head}<rect width="100%" height="100%" fill="#ffffff"/>'
+                f"{body}{modules.format(transform)}</svg>\n"
             )
-        )
-        frame_img.alpha_composite(qr)
-        white_bg = Image.new('RGBA', frame_img.size, 'WHITE')
-        frame_img = Image.alpha_composite(white_bg, frame_img)
-        frame_img.save(buf, format="PNG")
-        buf.seek(0)
 
-        return buf
+        if out is None:
+            return io.BytesIO(svg.encode())
+        out.write(svg.encode())
+        return out
 
-    def _generate_qr(self, code: str, frame=None, format="PNG"):
-        if format == "PNG":
-            if frame is None:
-                img = self._generate_plain_png(code)
-            else:
-                img = self._generate_framed_png(code, frame)
-        return img
+    def _generate_qr(
+        self,
+        code: str,
+        frame=None,
+        format="PNG",
+        error_correction: str = "M",
+        box_size: int = 10,
+        border: int = 4,
+        output=None,
+        size: int | None = None,
+        colors: int | None = None,
+        compress_level: int | None = None,
+    ):
+        # output is None for a BytesIO, bytes or memoryview for the image in
+        # that form (a memoryview shares the rendering buffer), or a sink: a
+        # binary file object, file descriptor, path or writable buffer, which
+        # is encoded into directly and the number of bytes written returned.
+        # size (target pixel width of the QR code), colors and compress_level
+        # (0-9 for PNG, 0-6 for WebP) only apply to raster formats.
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format {format!r}")
+        if error_correction not in ERROR_CORRECTION:
+            raise ValueError(f"Unsupported error correction {error_correction!r}")
+        options = {
+            "error_correction": error_correction,
+            "box_size": box_size,
+            "border": border,
+        }
+        raster = {"size": size, "colors": colors, "compress_level": compress_level}
+        if format == "SVG":
+            if any(value is not None for value in raster.values()):
+                raise ValueError(f"{', '.join(raster)} do not apply to SVG")
+        else:
+            options.update(raster, format=format)
+        cache = get_cache()
+        if cache is not None:
+            key = make_key("qr", code, frame, format, options)
+            img = cache.get(key)
+            if img is None:
+                img = self._render(code, frame, format, options).getvalue()
+                cache.set(key, img)
+            if output is None:
+                return io.BytesIO(img)
+            if output is bytes:
+                return img
+            if output is memoryview:
+                return memoryview(img)
+            with _open_output(output) as sink:
+                sink.write(img)
+            return sink.written
+
+        if output is None:
+            return self._render(code, frame, format, options)
+        if output is bytes:
+            return self._render(code, frame, format, options).getvalue()
+        if output is memoryview:
+            return self._render(code, frame, format, options).getbuffer()
+        with _open_output(output) as sink:
+            self._render(code, frame, format, options, sink)
+        return sink.written
+
+    def _render(
+        self, code: str, frame, format: str, options: dict, out=None
+    ) -> IO[bytes]:
+        if format == "SVG":
+            return self._generate_svg(code, frame, **options, out=out)
+        if frame is None:
+            return self._generate_plain_png(code, **options, out=out)
+        return self._generate_framed_png(code, frame, **options, out=out)
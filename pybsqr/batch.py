@@ -0,0 +1,148 @@
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, Iterator, NamedTuple
+
+from .base import BySquare
+from .bysquare import BUILDERS
+from .capacity import fit_fields
+from .invoice import InvoiceBySquare
+from .pay import PayBySquare
+from .xml import get_generator, warmup
+
+
+KINDS = {"pay": PayBySquare, "invoice": InvoiceBySquare}
+
+
+class BatchResult(NamedTuple):
+    index: int
+    code: str | None
+    error: str | None = None
+
+
+def generator_for(item, kind: str | None = None) -> BySquare:
+    if isinstance(item, tuple):
+        kind, item = item
+    if isinstance(item, (str, bytes)):
+        generator = get_generator(item)
+        if generator is None:
+            raise ValueError("Document is neither Pay nor Invoice")
+        return generator
+    if kind not in KINDS:
+        raise ValueError(f"Unknown document kind {kind!r}, expected 'pay' or 'invoice'")
+    if isinstance(item, dict):
+        return BUILDERS[kind](**item)
+    return KINDS[kind](fields=list(item))
+
+
+def code_for(
+    item,
+    kind: str | None = None,
+    max_version: int | None = None,
+    fit: str = "reject",
+    truncate: Iterable[str] | None = None,
+) -> str:
+    generator = generator_for(item, kind)
+    if max_version is None:
+        return generator.generate_code()
+    fields = fit_fields(
+        generator.fields,
+        generator.bysquare_type,
+        max_version,
+        strategy=fit,
+        truncate=truncate,
+    )
+    return generator.generate_code(fields)
+
+
+def _process_chunk(
+    chunk: list[tuple[int, object]],
+    kind: str | None,
+    max_version: int | None = None,
+    fit: str = "reject",
+    truncate: Iterable[str] | None = None,
+):
+    results = []
+    for index, item in chunk:
+        try:
+            code = code_for(item, kind, max_version, fit, truncate)
+            results.append(BatchResult(index, code))
+        except Exception as e:
+            results.append(BatchResult(index, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def map_chunks(
+    process_chunk,
+    items: Iterable,
+    *args,
+    jobs: int | None = None,
+    executor: str = "process",
+    chunksize: int = 64,
+    initializer=None,
+) -> Iterator:
+    jobs = jobs or os.cpu_count() or 1
+    chunks = _chunked(enumerate(items), chunksize)
+
+    if jobs == 1 or executor == "serial":
+        for chunk in chunks:
+            yield from process_chunk(chunk, *args)
+        return
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=initializer)
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    else:
+        raise ValueError(f"Unknown executor {executor!r}")
+
+    # Only keep a bounded number of chunks in flight, so arbitrarily long
+    # inputs are streamed instead of being materialized up front
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(process_chunk, chunk, *args))
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def generate_codes(
+    items: Iterable,
+    *,
+    kind: str | None = None,
+    jobs: int | None = None,
+    executor: str = "process",
+    chunksize: int = 64,
+    max_version: int | None = None,
+    fit: str = "reject",
+    truncate: Iterable[str] | None = None,
+) -> Iterator[BatchResult]:
+    # Items are XML documents (str or bytes), builder keyword dicts or field
+    # lists. Dicts and field lists need the document kind, either for the whole
+    # batch or per item as a (kind, payload) tuple. With max_version, codes
+    # that would not fit are rejected, or truncated with fit="truncate", before
+    # any rendering happens. truncate names the fields that may be shortened,
+    # PaymentNote, InvoiceDescription and ItemName by default.
+    return map_chunks(
+        _process_chunk,
+        items,
+        kind,
+        max_version,
+        fit,
+        truncate,
+        jobs=jobs,
+        executor=executor,
+        chunksize=chunksize,
+        initializer=warmup,
+    )
@@ -1,10 +1,15 @@
+from contextvars import ContextVar
 from datetime import date
 from decimal import Decimal
 from enum import Enum
+from functools import partial
 
 from lxml import etree, objectify
 
+from . import aio, checks
+from .base import BySquare
 from .invoice import InvoiceBySquare
+from .layout import PAYMENT_OPTIONS
 from .pay import PayBySquare
 from .xml import makeparser
 
@@ -14,6 +19,8 @@ NS_MAP = {
     "xsi": "http://www.w3.org/2001/XMLSchema-instance",
 }
 
+_template: ContextVar["Template | None"] = ContextVar("template", default=None)
+
 
 class PaymentType(Enum):
     PAYMENTORDER = "paymentorder"
@@ -31,10 +38,131 @@ class PaymentMean(Enum):
     OTHER = "other"
 
 
+def _date(value: str | date) -> str:
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _parse(xml: etree._Element):
+    return objectify.fromstring(etree.tostring(xml), makeparser())
+
+
+def _pay_xml(doc: dict) -> etree._Element:
+    xml = etree.Element(
+        "Pay",
+        attrib={"{http://www.w3.org/2001/XMLSchema-instance}type": "Pay"},
+        nsmap=NS_MAP,
+    )
+    etree.SubElement(xml, "InvoiceID").text = doc["InvoiceID"]
+    payments = etree.SubElement(xml, "Payments")
+    payment = etree.SubElement(payments, "Payment")
+    etree.SubElement(payment, "PaymentOptions").text = doc["PaymentOptions"]
+    etree.SubElement(payment, "Amount").text = doc["Amount"]
+    etree.SubElement(payment, "CurrencyCode").text = doc["CurrencyCode"]
+    etree.SubElement(payment, "PaymentDueDate").text = doc["PaymentDueDate"]
+    if doc["OriginatorsReferenceInformation"] is None:
+        etree.SubElement(payment, "VariableSymbol").text = doc["VariableSymbol"]
+        etree.SubElement(payment, "ConstantSymbol").text = doc["ConstantSymbol"]
+        etree.SubElement(payment, "SpecificSymbol").text = doc["SpecificSymbol"]
+    else:
+        etree.SubElement(payment, "OriginatorsReferenceInformation").text = doc[
+            "OriginatorsReferenceInformation"
+        ]
+    etree.SubElement(payment, "PaymentNote").text = doc["PaymentNote"]
+    accounts = etree.SubElement(payment, "BankAccounts")
+    account = etree.SubElement(accounts, "BankAccount")
+    etree.SubElement(account, "IBAN").text = doc["IBAN"]
+    if doc["BIC"]:
+        etree.SubElement(account, "BIC").text = doc["BIC"]
+    # etree.SubElement(payment, 'StandingOrderExt')
+    # etree.SubElement(payment, 'DirectDebitEx
+    etree.SubElement(payment, "BeneficiaryName").text = doc["BeneficiaryName"]
+    etree.SubElement(payment, "BeneficiaryAddressLine1").text = doc[
+        "BeneficiaryAddressLine1"
+    ]
+    etree.SubElement(payment, "BeneficiaryAddressLine2").text = doc[
+        "BeneficiaryAddressLine2"
+    ]
+    return xml
+
+
+def _pay_tree(doc: dict):
+    return _parse(_pay_xml(doc))
+
+
+def _checked(doc: dict) -> set:
+    # Elements equal to those of a document built from the same template,
+    # which passed the checks already
+    template = _template.get()
+    if template is None or template.reference is None:
+        return set()
+    reference = template.reference
+    return {
+        element
+        for element, value in doc.items()
+        if element in reference and reference[element] == value
+    }
+
+
+def _remember(doc: dict):
+    template = _template.get()
+    if template is not None and template.reference is None:
+        template.reference = doc
+
+
+def _check_pay(doc: dict):
+    checked = _checked(doc)
+    for element, value in doc.items():
+        if value is not None and element not in checked:
+            checks.check_string(element, value)
+    if "Amount" not in checked:
+        checks.check_decimal("Amount", doc["Amount"])
+    if "CurrencyCode" not in checked:
+        checks.check_currency("CurrencyCode", doc["CurrencyCode"])
+    if "PaymentDueDate" not in checked:
+        checks.check_date("PaymentDueDate", doc["PaymentDueDate"])
+    if doc["OriginatorsReferenceInformation"] is None:
+        if "VariableSymbol" not in checked:
+            checks.check_variable_symbol("VariableSymbol", doc["VariableSymbol"])
+        if "ConstantSymbol" not in checked:
+            checks.check_constant_symbol("ConstantSymbol", doc["ConstantSymbol"])
+        if "SpecificSymbol" not in checked:
+            checks.check_variable_symbol("SpecificSymbol", doc["SpecificSymbol"])
+    if "IBAN" not in checked:
+        checks.check_iban("IBAN", doc["IBAN"])
+    if doc["BIC"] and "BIC" not in checked:
+        checks.check_bic("BIC", doc["BIC"])
+    _remember(doc)
+
+
+def _pay_fields(doc: dict) -> list[str]:
+    payment_options = doc["PaymentOptions"].split()
+    return [
+        doc["InvoiceID"],
+        "1",
+        str(sum(PAYMENT_OPTIONS[po] for po in set(payment_options))),
+        doc["Amount"],
+        doc["CurrencyCode"],
+        doc["PaymentDueDate"].replace("-", ""),
+        doc["VariableSymbol"] or "",
+        doc["ConstantSymbol"] or "",
+        doc["SpecificSymbol"] or "",
+        doc["OriginatorsReferenceInformation"] or "",
+        doc["PaymentNote"],
+        "1",
+        doc["IBAN"],
+        doc["BIC"],
+        "0",
+        "0",
+        doc["BeneficiaryName"],
+        doc["BeneficiaryAddressLine1"],
+        doc["BeneficiaryAddressLine2"],
+    ]
+
+
 def create_pay_by_square(
     *,
     invoice_number: int | str = "",
-    payment_types: list[PaymentType] | None = None,
+    payment_types: list[PaymentType | str] | None = None,
     amount: str | Decimal,
     currency_code: str = "EUR",
     payment_due_date: str | date,
@@ -48,51 +176,212 @@ def create_pay_by_square(
     beneficiary_name: str = "",
     beneficiary_address_line1: str = "",
     beneficiary_address_line2: str = "",
+    validate: bool = False,
 ) -> PayBySquare:
+    has_symbols = bool(variable_symbol or constant_symbol or specific_symbol)
+    doc = {
+        "InvoiceID": str(invoice_number),
+        "PaymentOptions": " ".join(
+            map(
+                lambda pt: PaymentType(pt).value,
+                payment_types or [PaymentType.PAYMENTORDER],
+            )
+        ),
+        "Amount": str(amount),
+        "CurrencyCode": currency_code,
+        "PaymentDueDate": _date(payment_due_date),
+        "VariableSymbol": variable_symbol if has_symbols else None,
+        "ConstantSymbol": constant_symbol if has_symbols else None,
+        "SpecificSymbol": specific_symbol if has_symbols else None,
+        "OriginatorsReferenceInformation": (
+            None if has_symbols else originator_reference
+        ),
+        "PaymentNote": payment_note,
+        "IBAN": bank_account_iban,
+        "BIC": bank_account_bic,
+        "BeneficiaryName": beneficiary_name,
+        "BeneficiaryAddressLine1": beneficiary_address_line1,
+        "BeneficiaryAddressLine2": beneficiary_address_line2,
+    }
+    if validate:
+        return PayBySquare(_pay_tree(doc))
+    _check_pay(doc)
+    return PayBySquare(fields=_pay_fields(doc), xml_factory=partial(_pay_tree, doc))
+
+
+def _invoice_xml(doc: dict) -> etree._Element:
     xml = etree.Element(
-        "Pay",
-        attrib={"{http://www.w3.org/2001/XMLSchema-instance}type": "Pay"},
+        "Invoice",
+        attrib={"{http://www.w3.org/2001/XMLSchema-instance}type": "Invoice"},
         nsmap=NS_MAP,
     )
-    etree.SubElement(xml, "InvoiceID").text = invoice_number
-    payments = etree.SubElement(xml, "Payments")
-    payment = etree.SubElement(payments, "Payment")
-    etree.SubElement(payment, "PaymentOptions").text = " ".join(
-        map(lambda pt: pt.value, payment_types or [PaymentType.PAYMENTORDER])
-    )
-    etree.SubElement(payment, "Amount").text = str(amount)
-    etree.SubElement(payment, "CurrencyCode").text = currency_code
-    etree.SubElement(payment, "PaymentDueDate").text = (
-        payment_due_date.isoformat()
-        if isinstance(payment_due_date, date)
-        else payment_due_date
-    )
-    if variable_symbol or constant_symbol or specific_symbol:
-        etree.SubElement(payment, "VariableSymbol").text = variable_symbol
-        etree.SubElement(payment, "ConstantSymbol").text = constant_symbol
-        etree.SubElement(payment, "SpecificSymbol").text = specific_symbol
+
+    etree.SubElement(xml, "InvoiceID").text = doc["InvoiceID"]
+    etree.SubElement(xml, "IssueDate").text = doc["IssueDate"]
+    etree.SubElement(xml, "TaxPointDate").text = doc["TaxPointDate"]
+    etree.SubElement(xml, "LocalCurrencyCode").text = doc["LocalCurrencyCode"]
+
+    for party_tag in ("SupplierParty", "CustomerParty"):
+        party_doc = doc[party_tag]
+        party = etree.SubElement(xml, party_tag)
+        etree.SubElement(party, "PartyName").text = party_doc["PartyName"]
+        etree.SubElement(party, "CompanyTaxID").text = party_doc["CompanyTaxID"]
+        etree.SubElement(party, "CompanyVATID").text = party_doc["CompanyVATID"]
+        etree.SubElement(party, "CompanyRegisterID").text = party_doc[
+            "CompanyRegisterID"
+        ]
+
+        for tag in ("PostalAddress", "Contact"):
+            if tag in party_doc:
+                sub = etree.SubElement(party, tag)
+                for child_tag, text in party_doc[tag].items():
+                    etree.SubElement(sub, child_tag).text = text
+
+    if doc["SingleInvoiceLine"] is None:
+        etree.SubElement(xml, "NumberOfInvoiceLines").text = doc["NumberOfInvoiceLines"]
+        if doc["InvoiceDescription"] is not None:
+            etree.SubElement(xml, "InvoiceDescription").text = doc["InvoiceDescription"]
     else:
-        etree.SubElement(payment, "OriginatorsReferenceInformation").text = (
-            originator_reference
-        )
-    etree.SubElement(payment, "PaymentNote").text = payment_note
-    accounts = etree.SubElement(payment, "BankAccounts")
-    account = etree.SubElement(accounts, "BankAccount")
-    etree.SubElement(account, "IBAN").text = bank_account_iban
-    etree.SubElement(account, "BIC").text = bank_account_bic
-    # etree.SubElement(payment, 'StandingOrderExt')
-    # etree.SubElement(payment, 'DirectDebitEx
-    etree.SubElement(payment, "BeneficiaryName").text = beneficiary_name
-    etree.SubElement(payment, "BeneficiaryAddressLine1").text = (
-        beneficiary_address_line1
-    )
-    etree.SubElement(payment, "BeneficiaryAddressLine2").text = (
-        beneficiary_address_line2
+        single_invoice = etree.SubElement(xml, "SingleInvoiceLine")
+        for tag, text in doc["SingleInvoiceLine"].items():
+            if text is not None:
+                etree.SubElement(single_invoice, tag).text = text
+
+    tax_cat_summaries = etree.SubElement(xml, "TaxCategorySummaries")
+    for tax_category in doc["TaxCategorySummaries"]:
+        tax_cat_summary = etree.SubElement(tax_cat_summaries, "TaxCategorySummary")
+        for tag, text in tax_category.items():
+            etree.SubElement(tax_cat_summary, tag).text = text
+
+    summary = etree.SubElement(xml, "MonetarySummary")
+    for tag, text in doc["MonetarySummary"].items():
+        etree.SubElement(summary, tag).text = text
+
+    etree.SubElement(xml, "PaymentMeans").text = doc["PaymentMeans"]
+    return xml
+
+
+def _invoice_tree(doc: dict):
+    return _parse(_invoice_xml(doc))
+
+
+def _check_strings(doc: dict):
+    for tag, value in doc.items():
+        if isinstance(value, str):
+            checks.check_string(tag, value)
+        elif isinstance(value, dict):
+            _check_strings(value)
+        elif isinstance(value, list):
+            for item in value:
+                _check_strings(item)
+
+
+def _check_invoice(doc: dict):
+    checked = _checked(doc)
+    _check_strings(
+        {element: value for element, value in doc.items() if element not in checked}
     )
+    if "IssueDate" not in checked:
+        checks.check_date("IssueDate", doc["IssueDate"])
+    if "TaxPointDate" not in checked:
+        checks.check_date("TaxPointDate", doc["TaxPointDate"])
+    if "LocalCurrencyCode" not in checked:
+        checks.check_currency("LocalCurrencyCode", doc["LocalCurrencyCode"])
+    if "SupplierParty" not in checked:
+        checks.check_country(
+            "Country", doc["SupplierParty"]["PostalAddress"]["Country"]
+        )
+
+    if doc["SingleInvoiceLine"] is None:
+        if "NumberOfInvoiceLines" not in checked:
+            checks.check_integer("NumberOfInvoiceLines", doc["NumberOfInvoiceLines"])
+    elif "SingleInvoiceLine" not in checked:
+        line = doc["SingleInvoiceLine"]
+        if line["PeriodFromDate"] is not None:
+            checks.check_date("PeriodFromDate", line["PeriodFromDate"])
+            checks.check_date("PeriodToDate", line["PeriodToDate"])
+        checks.check_decimal("InvoicedQuantity", line["InvoicedQuantity"])
+
+    if not doc["TaxCategorySummaries"]:
+        raise checks.ValidationError(
+            "TaxCategorySummaries", [], "must contain at least one TaxCategorySummary"
+        )
+    if "TaxCategorySummaries" not in checked:
+        for summary in doc["TaxCategorySummaries"]:
+            checks.check_percentage(
+                "ClassifiedTaxCategory", summary["ClassifiedTaxCategory"]
+            )
+            for tag in (
+                "TaxExclusiveAmount",
+                "TaxAmount",
+                "AlreadyClaimedTaxExclusiveAmount",
+                "AlreadyClaimedTaxAmount",
+            ):
+                checks.check_decimal(tag, summary[tag])
 
-    xml_str = etree.tostring(xml)
-    parser = makeparser()
-    return PayBySquare(objectify.fromstring(xml_str, parser))
+    if "MonetarySummary" not in checked:
+        for tag, value in doc["MonetarySummary"].items():
+            checks.check_decimal(tag, value)
+    _remember(doc)
+
+
+def _invoice_fields(doc: dict) -> list[str]:
+    supplier = doc["SupplierParty"]
+    address = supplier["PostalAddress"]
+    contact = supplier["Contact"]
+    customer = doc["CustomerParty"]
+
+    fields = [
+        doc["InvoiceID"],
+        doc["IssueDate"].replace("-", ""),
+        doc["TaxPointDate"].replace("-", ""),
+        "",
+        "",
+        doc["LocalCurrencyCode"],
+        "",
+        "",
+        "",
+        supplier["PartyName"],
+        supplier["CompanyTaxID"],
+        supplier["CompanyVATID"],
+        supplier["CompanyRegisterID"],
+        address["StreetName"],
+        address["BuildingNumber"],
+        address["CityName"],
+        address["PostalZone"],
+        address["State"],
+        address["Country"],
+        contact["Name"],
+        contact["Telephone"],
+        contact["EMail"],
+        customer["PartyName"],
+        customer["CompanyTaxID"],
+        customer["CompanyVATID"],
+        customer["CompanyRegisterID"],
+        "",
+    ]
+
+    line = doc["SingleInvoiceLine"]
+    if line is None:
+        fields.append(doc["NumberOfInvoiceLines"])
+        fields.append(doc["InvoiceDescription"] or "")
+        fields.extend([""] * 7)
+    else:
+        fields.extend(["", ""])
+        fields.append(line["OrderLineID"])
+        fields.append(line["DeliveryNoteLineID"])
+        fields.append(line["ItemName"] or "")
+        fields.append(line["ItemEANCode"] or "")
+        fields.append((line["PeriodFromDate"] or "").replace("-", ""))
+        fields.append((line["PeriodToDate"] or "").replace("-", ""))
+        fields.append(line["InvoicedQuantity"])
+
+    fields.append(str(len(doc["TaxCategorySummaries"])))
+    for summary in doc["TaxCategorySummaries"]:
+        fields.extend(summary.values())
+
+    fields.extend(doc["MonetarySummary"].values())
+    return fields
 
 
 def create_invoice_by_square(
@@ -130,108 +419,125 @@ def create_invoice_by_square(
     tax_summaries: list[dict],
     total_rounding_amount: str | Decimal = "0",
     total_deposit_amount: str | Decimal = "0",
-    payment_means: list[PaymentMean] | None = None,
+    payment_means: list[PaymentMean | str] | None = None,
+    validate: bool = False,
 ) -> InvoiceBySquare:
-    xml = etree.Element(
-        "Invoice",
-        attrib={"{http://www.w3.org/2001/XMLSchema-instance}type": "Invoice"},
-        nsmap=NS_MAP,
-    )
-
-    etree.SubElement(xml, "InvoiceID").text = invoice_number
-    etree.SubElement(xml, "IssueDate").text = (
-        issue_date.isoformat() if isinstance(issue_date, date) else issue_date
-    )
-    etree.SubElement(xml, "TaxPointDate").text = (
-        tax_date.isoformat() if isinstance(tax_date, date) else tax_date
-    )
-    etree.SubElement(xml, "LocalCurrencyCode").text = currency_code
-
-    supplier = etree.SubElement(xml, "SupplierParty")
-    etree.SubElement(supplier, "PartyName").text = supplier_name
-    etree.SubElement(supplier, "CompanyTaxID").text = supplier_dic
-    etree.SubElement(supplier, "CompanyVATID").text = supplier_icdph
-    etree.SubElement(supplier, "CompanyRegisterID").text = supplier_ico
-
-    postal_address = etree.SubElement(supplier, "PostalAddress")
-    etree.SubElement(postal_address, "StreetName").text = supplier_street
-    etree.SubElement(postal_address, "BuildingNumber").text = supplier_street_number
-    etree.SubElement(postal_address, "CityName").text = supplier_city
-    etree.SubElement(postal_address, "PostalZone").text = supplier_zip
-    etree.SubElement(postal_address, "State").text = supplier_state
-    etree.SubElement(postal_address, "Country").text = supplier_country
-
-    contact = etree.SubElement(supplier, "Contact")
-    etree.SubElement(contact, "Name").text = supplier_contact_name
-    etree.SubElement(contact, "Telephone").text = supplier_contact_phone
-    etree.SubElement(contact, "EMail").text = supplier_contact_email
-
-    customer = etree.SubElement(xml, "CustomerParty")
-    etree.SubElement(customer, "PartyName").text = customer_name
-    etree.SubElement(customer, "CompanyTaxID").text = customer_dic
-    etree.SubElement(customer, "CompanyVATID").text = customer_icdph
-    etree.SubElement(customer, "CompanyRegisterID").text = customer_ico
+    doc = {
+        "InvoiceID": invoice_number,
+        "IssueDate": _date(issue_date),
+        "TaxPointDate": _date(tax_date),
+        "LocalCurrencyCode": currency_code,
+        "SupplierParty": {
+            "PartyName": supplier_name,
+            "CompanyTaxID": supplier_dic,
+            "CompanyVATID": supplier_icdph,
+            "CompanyRegisterID": supplier_ico,
+            "PostalAddress": {
+                "StreetName": supplier_street,
+                "BuildingNumber": supplier_street_number,
+                "CityName": supplier_city,
+                "PostalZone": supplier_zip,
+                "State": supplier_state,
+                "Country": supplier_country,
+            },
+            "Contact": {
+                "Name": supplier_contact_name,
+                "Telephone": supplier_contact_phone,
+                "EMail": supplier_contact_email,
+            },
+        },
+        "CustomerParty": {
+            "PartyName": customer_name,
+            "CompanyTaxID": customer_dic,
+            "CompanyVATID": customer_icdph,
+            "CompanyRegisterID": customer_ico,
+        },
+        "NumberOfInvoiceLines": None,
+        "InvoiceDescription": None,
+        "SingleInvoiceLine": None,
+    }
 
     if not invoice_item_count:
-        etree.SubElement(xml, "NumberOfInvoiceLines").text = "0"
+        doc["NumberOfInvoiceLines"] = "0"
     elif invoice_item_count > 1:
-        etree.SubElement(xml, "NumberOfInvoiceLines").text = str(invoice_item_count)
-        etree.SubElement(xml, "InvoiceDescription").text = invoice_description
+        doc["NumberOfInvoiceLines"] = str(invoice_item_count)
+        doc["InvoiceDescription"] = invoice_description
     else:
-        single_invoice = etree.SubElement(xml, "SingleInvoiceLine")
-        etree.SubElement(single_invoice, "OrderLineID").text = (
-            invoice_item_order_line_id
-        )
-        etree.SubElement(single_invoice, "DeliveryNoteLineID").text = (
-            invoice_item_delivery_note_line_id
-        )
-        if invoice_item_text:
-            etree.SubElement(single_invoice, "ItemName").text = invoice_item_text
-        else:
-            etree.SubElement(single_invoice, "ItemEANCode").text = invoice_item_ean_code
-        if invoice_item_period_from and invoice_item_period_to:
-            etree.SubElement(single_invoice, "PeriodFromDate").text = (
-                invoice_item_period_from.isoformat
-                if isinstance(invoice_item_period_from, date)
-                else invoice_item_period_from
-            )
-            etree.SubElement(single_invoice, "PeriodToDate").text = (
-                invoice_item_period_to.isoformat
-                if isinstance(invoice_item_period_to, date)
-                else invoice_item_period_to
-            )
-        etree.SubElement(single_invoice, "InvoicedQuantity").text = str(
-            invoice_item_quantity
+        has_period = bool(invoice_item_period_from and invoice_item_period_to)
+        doc["SingleInvoiceLine"] = {
+            "OrderLineID": invoice_item_order_line_id,
+            "DeliveryNoteLineID": invoice_item_delivery_note_line_id,
+            "ItemName": invoice_item_text or None,
+            "ItemEANCode": None if invoice_item_text else invoice_item_ean_code,
+            "PeriodFromDate": (_date(invoice_item_period_from) if has_period else None),
+            "PeriodToDate": _date(invoice_item_period_to) if has_period else None,
+            "InvoicedQuantity": str(invoice_item_quantity),
+        }
+
+    doc["TaxCategorySummaries"] = [
+        {
+            "ClassifiedTaxCategory": str(tax_category["tax_category"]),
+            "TaxExclusiveAmount": str(tax_category["price_ex_vat"]),
+            "TaxAmount": str(tax_category["vat_amount"]),
+            "AlreadyClaimedTaxExclusiveAmount": str(
+                tax_category.get("deposit_price_ex_vat", 0)
+            ),
+            "AlreadyClaimedTaxAmount": str(tax_category.get("deposit_vat_amount", 0)),
+        }
+        for tax_category in tax_summaries
+    ]
+    doc["MonetarySummary"] = {
+        "PayableRoundingAmount": str(total_rounding_amount),
+        "PaidDepositsAmount": str(total_deposit_amount),
+    }
+    doc["PaymentMeans"] = " ".join(
+        map(
+            lambda pm: PaymentMean(pm).value,
+            payment_means or [PaymentMean.MONEYTRANSFER],
         )
+    )
 
-    tax_cat_summaries = etree.SubElement(xml, "TaxCategorySummaries")
+    if validate:
+        return InvoiceBySquare(_invoice_tree(doc))
+    _check_invoice(doc)
+    return InvoiceBySquare(
+        fields=_invoice_fields(doc), xml_factory=partial(_invoice_tree, doc)
+    )
 
-    for tax_category in tax_summaries:
-        tax_cat_summary = etree.SubElement(tax_cat_summaries, "TaxCategorySummary")
-        etree.SubElement(tax_cat_summary, "ClassifiedTaxCategory").text = str(
-            tax_category["tax_category"]
-        )
-        etree.SubElement(tax_cat_summary, "TaxExclusiveAmount").text = str(
-            tax_category["price_ex_vat"]
-        )
-        etree.SubElement(tax_cat_summary, "TaxAmount").text = str(
-            tax_category["vat_amount"]
-        )
-        etree.SubElement(tax_cat_summary, "AlreadyClaimedTaxExclusiveAmount").text = (
-            str(tax_category.get("deposit_price_ex_vat", 0))
-        )
-        etree.SubElement(tax_cat_summary, "AlreadyClaimedTaxAmount").text = str(
-            tax_category.get("deposit_vat_amount", 0)
-        )
 
-    summary = etree.SubElement(xml, "MonetarySummary")
-    etree.SubElement(summary, "PayableRoundingAmount").text = str(total_rounding_amount)
-    etree.SubElement(summary, "PaidDepositsAmount").text = str(total_deposit_amount)
+# Builders by the document kinds of batch manifests and the server
+BUILDERS = {"pay": create_pay_by_square, "invoice": create_invoice_by_square}
 
-    etree.SubElement(xml, "PaymentMeans").text = " ".join(
-        map(lambda pm: pm.value, payment_means or [PaymentMean.MONEYTRANSFER])
-    )
 
-    xml_str = etree.tostring(xml)
-    parser = makeparser()
-    return InvoiceBySquare(objectify.fromstring(xml_str, parser))
+async def acreate_pay_by_square(**kwargs) -> PayBySquare:
+    return await aio.run(create_pay_by_square, **kwargs)
+
+
+async def acreate_invoice_by_square(**kwargs) -> InvoiceBySquare:
+    return await aio.run(create_invoice_by_square, **kwargs)
+
+
+class Template:
+    # Builds a series of documents that share the arguments given here, like
+    # the supplier of invoices or the beneficiary of payments:
+    #
+    #     template = Template(create_invoice_by_square, supplier_name=..., ...)
+    #     generator = template.create(invoice_number=..., ...)
+    #
+    # The first document is checked in full, later ones only where they differ
+    # from it, so validation costs what changes between documents.
+
+    def __init__(self, builder, **constant):
+        self.builder = builder
+        self.constant = constant
+        self.reference: dict | None = None
+
+    def create(self, **varying) -> BySquare:
+        token = _template.set(self)
+        try:
+            return self.builder(**{**self.constant, **varying})
+        finally:
+            _template.reset(token)
+
+    def generate_code(self, **varying) -> str:
+        return self.create(**varying).generate_code()
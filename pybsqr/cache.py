@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    import pathlib
+
+
+class ResultCache:
+
+    def __init__(
+        self,
+        max_items: int = 4096,
+        max_bytes: int = 64 * 2**20,
+        directory: str | os.PathLike | None = None,
+    ):
+        import pathlib
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.directory = pathlib.Path(directory) if directory is not None else None
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> "pathlib.Path":
+        return self.directory / key[:2] / key
+
+    def _remember(self, key: str, value: bytes):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            if len(value) > self.max_bytes:
+                return
+            self._items[key] = value
+            self._size += len(value)
+            while len(self._items) > self.max_items or self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                return value
+        if self.directory is None:
+            return None
+        try:
+            value = self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: bytes):
+        import tempfile
+
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first so concurrent readers, possibly in
+        # other processes, never see a partially written entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_cache: ResultCache | None = None
+
+
+def set_cache(cache: ResultCache | None):
+    global _cache
+    _cache = cache
+
+
+def get_cache() -> ResultCache | None:
+    return _cache
+
+
+def make_key(*parts) -> str:
+    import hashlib
+
+    # repr keeps field boundaries unambiguous, unlike joining the fields
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
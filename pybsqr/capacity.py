@@ -0,0 +1,107 @@
+from typing import Iterable, NamedTuple
+
+from . import layout
+from .base import code_length, encode_payload
+from .bysquare import BUILDERS
+from .qr import DataOverflowError, min_version
+
+
+# Fields shortened by default, identifiers like InvoiceID or PartyName only
+# when asked for explicitly
+FREE_TEXT = ("PaymentNote", "InvoiceDescription", "ItemName")
+
+
+class CodeTooLongError(ValueError):
+    pass
+
+
+class CodeSize(NamedTuple):
+    compressed_bytes: int
+    code_length: int
+    # None when the code does not fit into any QR version
+    version: int | None
+
+
+def code_size(fields: list[str], type_: int, error_correction: str = "M") -> CodeSize:
+    payload = encode_payload(fields, type_)
+    length = code_length(payload)
+    try:
+        version = min_version(length, error_correction)
+    except DataOverflowError:
+        version = None
+    return CodeSize(len(payload), length, version)
+
+
+def builder_code_size(kind: str, kwargs: dict, error_correction: str = "M") -> CodeSize:
+    # Sizes the fields create_*_by_square would produce, without building XML
+    generator = BUILDERS[kind](**kwargs)
+    return code_size(generator.fields, generator.bysquare_type, error_correction)
+
+
+def _fits(size: CodeSize, max_version: int) -> bool:
+    return size.version is not None and size.version <= max_version
+
+
+def _describe(size: CodeSize, max_version: int, error_correction: str) -> str:
+    needed = (
+        f"QR version {size.version}"
+        if size.version is not None
+        else "more than QR version 40"
+    )
+    return (
+        f"Code of {size.code_length} characters needs {needed} at error"
+        f" correction {error_correction}, the limit is version {max_version}"
+    )
+
+
+def fit_fields(
+    fields: list[str],
+    type_: int,
+    max_version: int = 40,
+    error_correction: str = "M",
+    strategy: str = "truncate",
+    truncate: Iterable[str] | None = None,
+) -> list[str]:
+    # Returns fields whose code fits into max_version. With the "truncate"
+    # strategy the fields whose tags are listed in truncate, FREE_TEXT by
+    # default, are shortened in the order of their bsqr:priority; "reject"
+    # raises CodeTooLongError right away.
+    if strategy not in ("truncate", "reject"):
+        raise ValueError(f"Unknown strategy {strategy!r}")
+    fields = list(map(str, fields))
+    size = code_size(fields, type_, error_correction)
+    if _fits(size, max_version):
+        return fields
+    if strategy == "reject":
+        raise CodeTooLongError(_describe(size, max_version, error_correction))
+
+    allowed = set(FREE_TEXT if truncate is None else truncate)
+    candidates = sorted(
+        (field.priority, index)
+        for index, field in layout.field_positions(type_, fields)
+        if field.priority is not None and fields[index] and field.tag in allowed
+    )
+    for _, index in candidates:
+        value = fields[index]
+        fields[index] = ""
+        if not _fits(code_size(fields, type_, error_correction), max_version):
+            continue
+        # Emptying this field is enough, keep the longest prefix that fits.
+        # Compressed sizes are not strictly monotonic, so only prefixes that
+        # were actually measured are kept.
+        low, high = 0, len(value)
+        while high - low > 1:
+            middle = (low + high) // 2
+            fields[index] = value[:middle]
+            if _fits(code_size(fields, type_, error_correction), max_version):
+                low = middle
+            else:
+                high = middle
+        fields[index] = value[:low]
+        return fields
+
+    size = code_size(fields, type_, error_correction)
+    raise CodeTooLongError(
+        _describe(size, max_version, error_correction)
+        + " even with all truncatable fields emptied"
+    )
@@ -0,0 +1,89 @@
+import re
+from datetime import date
+from decimal import Decimal
+
+
+# Lightweight equivalents of the bysquare.xsd simple types, used by the
+# builders when full schema validation is switched off and by validate.py.
+# Values go into codes as they are, so surrounding whitespace is not
+# accepted, nor the time zones of dates, which codes carry as YYYYMMDD.
+
+_CURRENCY = re.compile(r"[A-Z]{3}")
+_IBAN = re.compile(r"[A-Z]{2}[0-9]{2}[A-Z0-9]{0,30}")
+_BIC = re.compile(r"[A-Z]{4}[A-Z]{2}[A-Z\d]{2}([A-Z\d]{3})?")
+_VARIABLE_SYMBOL = re.compile(r"[0-9]{0,10}")
+_CONSTANT_SYMBOL = re.compile(r"[0-9]{0,4}")
+_DECIMAL = re.compile(r"[+-]?(\d+(\.\d*)?|\.\d+)")
+_INTEGER = re.compile(r"[+-]?\d+")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+class ValidationError(ValueError):
+
+    def __init__(self, element: str, value, reason: str):
+        self.element = element
+        self.value = value
+        self.reason = reason
+        super().__init__(f"Element '{element}': the value {value!r} {reason}.")
+
+
+def check_pattern(element: str, value: str, pattern: re.Pattern):
+    if pattern.fullmatch(value) is None:
+        raise ValidationError(
+            element, value, f"is not accepted by the pattern '{pattern.pattern}'"
+        )
+
+
+def check_string(element: str, value: str):
+    if _XML_INVALID.search(value) is not None:
+        raise ValidationError(element, value, "contains characters not allowed in XML")
+
+
+def check_decimal(element: str, value: str) -> Decimal:
+    if _DECIMAL.fullmatch(value) is None:
+        raise ValidationError(element, value, "is not a valid value of 'decimal'")
+    return Decimal(value)
+
+
+def check_integer(element: str, value: str):
+    if _INTEGER.fullmatch(value) is None:
+        raise ValidationError(element, value, "is not a valid value of 'integer'")
+
+
+def check_percentage(element: str, value: str):
+    if not 0 <= check_decimal(element, value) <= 1:
+        raise ValidationError(element, value, "is not a percentage between 0 and 1")
+
+
+def check_date(element: str, value: str):
+    try:
+        if _DATE.fullmatch(value) is None:
+            raise ValueError
+        date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(element, value, "is not a valid value of 'date'")
+
+
+def check_currency(element: str, value: str):
+    check_pattern(element, value, _CURRENCY)
+
+
+def check_country(element: str, value: str):
+    check_pattern(element, value, _CURRENCY)
+
+
+def check_iban(element: str, value: str):
+    check_pattern(element, value, _IBAN)
+
+
+def check_bic(element: str, value: str):
+    check_pattern(element, value, _BIC)
+
+
+def check_variable_symbol(element: str, value: str):
+    check_pattern(element, value, _VARIABLE_SYMBOL)
+
+
+def check_constant_symbol(element: str, value: str):
+    check_pattern(element, value, _CONSTANT_SYMBOL)
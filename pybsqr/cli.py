@@ -1,10 +1,206 @@
 import argparse
 import sys
+from typing import TYPE_CHECKING
 
-from .xml import get_generator
+from .xml import get_generator, warmup
+
+
+# Only the modules of `pybsqr --code` are imported up front, see "Startup
+# time" in README.md. The batch, validation and filter modes import theirs.
+if TYPE_CHECKING:
+    import pathlib
+
+
+def _record(record: dict, index: int) -> tuple[str, object]:
+    import pathlib
+
+    name = str(record.get("name") or f"{index:06d}")
+    if "xml" in record:
+        return name, record["xml"]
+    if "file" in record:
+        return name, pathlib.Path(record["file"])
+    if "fields" in record:
+        return name, (record.get("kind"), record["fields"])
+    return name, (record.get("kind"), record.get("data", {}))
+
+
+def _read_manifest(path: "pathlib.Path"):
+    import json
+
+    if path.suffix in (".ndjson", ".jsonl", ".json"):
+        with open(path, "r") as f:
+            for index, line in enumerate(f):
+                if line.strip():
+                    yield _record(json.loads(line), index)
+        return
+
+    from lxml import etree
+
+    _, root = next(etree.iterparse(str(path), events=("start",)))
+    if root.tag.endswith(("}Pay", "}Invoice")):
+        yield path.stem, path
+        return
+    from .stream import documents
+
+    for index, document in enumerate(documents(path)):
+        yield f"{index:06d}", document
+
+
+def _sources(source: str):
+    import glob
+    import pathlib
+
+    path = pathlib.Path(source)
+    if path.is_dir():
+        for file in sorted(path.glob("*.xml")):
+            yield file.stem, file
+    elif path.is_file():
+        yield from _read_manifest(path)
+    else:
+        for file in sorted(glob.glob(source)):
+            yield pathlib.Path(file).stem, pathlib.Path(file)
+
+
+def _process_chunk(
+    chunk: list, output_dir: str | None, frame: bool, format: str, options: dict
+):
+    import pathlib
+
+    from .batch import generator_for
+
+    results = []
+    for index, (name, item) in chunk:
+        try:
+            if isinstance(item, pathlib.Path):
+                item = item.read_bytes()
+            generator = generator_for(item)
+            code = generator.generate_code()
+            if output_dir is not None:
+                path = pathlib.Path(output_dir) / f"{name}.{format.lower()}"
+                generator.generate_qr(
+                    frame=frame, format=format, output=path, **options
+                )
+            results.append((name, code, None))
+        except Exception as e:
+            results.append((name, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _render_options(args: argparse.Namespace) -> dict:
+    return {
+        "error_correction": args.error_correction,
+        "box_size": args.box_size,
+        "border": args.border,
+        "size": args.size,
+        "colors": args.colors,
+        "compress_level": args.compress_level,
+    }
+
+
+def batch(args: argparse.Namespace) -> int:
+    import pathlib
+
+    from .batch import map_chunks
+
+    if args.output_dir:
+        pathlib.Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    out = open(args.output, "w") if args.output else sys.stdout
+    failed = 0
+    try:
+        for name, code, error in map_chunks(
+            _process_chunk,
+            _sources(args.batch),
+            args.output_dir,
+            args.frame,
+            args.format,
+            _render_options(args),
+            jobs=args.jobs,
+            chunksize=16,
+            initializer=warmup,
+        ):
+            if error is None:
+                out.write(f"{name}\t{code}\n")
+            else:
+                failed += 1
+                print(f"{name}\t{error}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+def validate(args: argparse.Namespace) -> int:
+    import json
+    import pathlib
+
+    from .validate import validate_documents
+
+    if args.batch:
+        sources = _sources(args.batch)
+    elif args.xml_file:
+        sources = [(pathlib.Path(args.xml_file).stem, pathlib.Path(args.xml_file))]
+    else:
+        sources = [("stdin", sys.stdin.buffer.read())]
+    names = {}
+
+    def items():
+        for index, (name, item) in enumerate(sources):
+            names[index] = name
+            yield item
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    invalid = 0
+    try:
+        for report in validate_documents(items(), jobs=args.jobs, chunksize=16):
+            invalid += not report.valid
+            record = {
+                "name": names.pop(report.index),
+                "kind": report.kind,
+                "valid": report.valid,
+                "errors": [issue._asdict() for issue in report.issues],
+            }
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if invalid else 0
+
+
+def filter_(args: argparse.Namespace) -> int:
+    import json
+    import pathlib
+
+    from .batch import generator_for
+
+    failed = 0
+    for index, line in enumerate(sys.stdin):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith("{"):
+                _, item = _record(json.loads(line), index)
+                if isinstance(item, pathlib.Path):
+                    item = item.read_bytes()
+            else:
+                item = line
+            code = generator_for(item).generate_code()
+        except Exception as e:
+            failed += 1
+            code = ""
+            print(f"{index}\t{type(e).__name__}: {e}", file=sys.stderr, flush=True)
+        # One output line per input record, so consumers can stay in lockstep
+        print(code, flush=True)
+    return 1 if failed else 0
 
 
 def main(args: argparse.Namespace):
+    if args.validate:
+        sys.exit(validate(args))
+    if args.batch:
+        sys.exit(batch(args))
+    if args.filter:
+        sys.exit(filter_(args))
     if args.xml_file:
         with open(args.xml_file, "r") as f:
             xml = f.read()
@@ -16,15 +212,19 @@ def main(args: argparse.Namespace):
     if args.code:
         print(code)
         return
-    qr = generator.generate_qr(frame=args.frame)
-    if not args.output:
-        sys.stdout.buffer.write(qr.read())
-    else:
-        with open(args.output, "wb") as f:
-            f.write(qr.read())
+    generator.generate_qr(
+        frame=args.frame,
+        format=args.format,
+        output=args.output or sys.stdout.buffer,
+        **_render_options(args),
+    )
 
 
 def run():
+    if sys.argv[1:2] == ["serve"]:
+        from .server import run as serve
+
+        return serve(sys.argv[2:])
     parser = argparse.ArgumentParser(
         prog="pybsqr", description="Tool for generating BySquare images from XML"
     )
@@ -39,6 +239,53 @@ def run():
         default=True,
         help="No BySquare frame around QR",
     )
+    parser.add_argument(
+        "--format",
+        choices=["PNG", "WEBP", "BMP", "SVG"],
+        default="PNG",
+        help="Image format",
+    )
+    parser.add_argument(
+        "--error-correction",
+        choices=["L", "M", "Q", "H"],
+        default="M",
+        help="QR error correction level",
+    )
+    parser.add_argument("--box-size", type=int, default=10, help="Pixels per QR module")
+    parser.add_argument(
+        "--border", type=int, default=4, help="Quiet zone width in modules"
+    )
+    parser.add_argument(
+        "--size", type=int, help="Pixel width of the QR code, overrides --box-size"
+    )
+    parser.add_argument(
+        "--colors", type=int, help="Palette size of framed raster images"
+    )
+    parser.add_argument("--compress-level", type=int, help="0-9 for PNG, 0-6 for WEBP")
+    parser.add_argument(
+        "--batch",
+        metavar="SOURCE",
+        help="Directory, glob or NDJSON/XML manifest of documents; writes"
+        " 'name<TAB>code' lines to the output",
+    )
+    parser.add_argument(
+        "--output-dir", help="Write images of batch documents to this directory"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Number of batch workers"
+    )
+    parser.add_argument(
+        "--filter",
+        action="store_true",
+        help="Read one XML document or JSON record per stdin line and print"
+        " one code per line",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Only validate XML_FILE or the --batch documents, writing one JSON"
+        " report per document",
+    )
     parser.add_argument("xml_file", metavar="XML_FILE", nargs="?")
     args = parser.parse_args()
     main(args)
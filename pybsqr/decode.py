@@ -0,0 +1,155 @@
+import base64
+import binascii
+import lzma
+from typing import Iterable, Iterator, NamedTuple
+
+from lxml import etree, objectify
+
+from . import layout
+from .base import BySquare
+from .batch import map_chunks
+from .invoice import InvoiceBySquare
+from .pay import PayBySquare
+
+
+GENERATORS = {
+    PayBySquare.bysquare_type: PayBySquare,
+    InvoiceBySquare.bysquare_type: InvoiceBySquare,
+}
+
+_LZMA_FILTERS = [
+    {"id": lzma.FILTER_LZMA1, "lc": 3, "lp": 0, "pb": 2, "dict_size": 2**17}
+]
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class DecodeResult(NamedTuple):
+    index: int
+    type_: int | None
+    fields: list[str] | None
+    error: str | None = None
+
+
+def decode_code(code: str) -> tuple[int, list[str]]:
+    code = code.strip().upper()
+    try:
+        data = base64.b32hexdecode(code + "=" * (-len(code) % 8))
+    except binascii.Error as e:
+        raise DecodeError(f"Code is not valid base32hex: {e}") from None
+    if len(data) < 4:
+        raise DecodeError("Code is too short")
+
+    # Upper nibble of the first byte is the bysquare type, lower the version
+    type_ = data[0] & 0xF0
+    if type_ not in GENERATORS:
+        raise DecodeError(f"Unsupported bysquare type {data[0] >> 4}")
+    length = int.from_bytes(data[2:4], "little")
+
+    decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    try:
+        # Codes from other generators may lack the LZMA end marker, so stop at
+        # the declared length instead of relying on it
+        decompressed = decompressor.decompress(data[4:], max_length=length)
+    except lzma.LZMAError as e:
+        raise DecodeError(f"Corrupted payload: {e}") from None
+    if len(decompressed) != length:
+        raise DecodeError(
+            f"Payload has {len(decompressed)} bytes, header declares {length}"
+        )
+
+    checksum, payload = decompressed[:4], decompressed[4:]
+    if binascii.crc32(payload).to_bytes(4, "little") != checksum:
+        raise DecodeError("Checksum mismatch")
+
+    return type_, payload.decode().split("\t")
+
+
+def _convert(field: layout.Field, value: str) -> str:
+    if not value:
+        return value
+    if field.date and len(value) == 8:
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    if field.flags is not None:
+        bits = int(value)
+        return " ".join(name for name, bit in field.flags.items() if bits & bit)
+    if field.codes is not None:
+        for name, code in field.codes.items():
+            if code == value:
+                return name
+    return value
+
+
+def _build(items: tuple, fields: Iterator[str], parent: etree._Element) -> bool:
+    filled = False
+    for item in items:
+        tag = f"{{{layout.NS}}}{item.tag}"
+        if isinstance(item, layout.Field):
+            value = _convert(item, next(fields, ""))
+            if value or item.required:
+                etree.SubElement(parent, tag).text = value
+            filled = filled or bool(value)
+        elif isinstance(item, layout.Group):
+            element = etree.Element(tag)
+            if _build(item.layout, fields, element) or item.required:
+                parent.append(element)
+                filled = True
+        elif isinstance(item, layout.Repeated):
+            container = etree.SubElement(parent, tag)
+            for _ in range(int(next(fields, "") or 0)):
+                element = etree.SubElement(container, f"{{{layout.NS}}}{item.item}")
+                _build(item.layout, fields, element)
+                filled = True
+        elif isinstance(item, layout.Extension):
+            if next(fields, "0") == "1":
+                _build(item.layout, fields, etree.SubElement(parent, tag))
+                filled = True
+    return filled
+
+
+def fields_to_xml(type_: int, fields: list[str]) -> etree._Element:
+    root_tag, items = layout.LAYOUTS[type_]
+    xml = etree.Element(
+        f"{{{layout.NS}}}{root_tag}",
+        attrib={"{http://www.w3.org/2001/XMLSchema-instance}type": root_tag},
+        nsmap={None: layout.NS, "xsi": "http://www.w3.org/2001/XMLSchema-instance"},
+    )
+    _build(items, iter(fields), xml)
+    return xml
+
+
+def _objectify(type_: int, fields: list[str]):
+    return objectify.fromstring(etree.tostring(fields_to_xml(type_, fields)))
+
+
+def decode(code: str) -> BySquare:
+    type_, fields = decode_code(code)
+    generator = GENERATORS[type_](
+        fields=fields, xml_factory=lambda: _objectify(type_, fields)
+    )
+    generator._code = code
+    return generator
+
+
+def _process_chunk(chunk: list[tuple[int, str]]):
+    results = []
+    for index, code in chunk:
+        try:
+            results.append(DecodeResult(index, *decode_code(code)))
+        except Exception as e:
+            results.append(DecodeResult(index, None, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def decode_codes(
+    codes: Iterable[str],
+    *,
+    jobs: int | None = None,
+    executor: str = "process",
+    chunksize: int = 256,
+) -> Iterator[DecodeResult]:
+    return map_chunks(
+        _process_chunk, codes, jobs=jobs, executor=executor, chunksize=chunksize
+    )
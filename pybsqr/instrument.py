@@ -0,0 +1,104 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from typing import Callable, ContextManager, NamedTuple
+
+
+class StageRecord(NamedTuple):
+    stage: str
+    duration: float
+    info: dict
+
+
+class Collector:
+    # Exporter aggregating durations per stage, keeping the info of the last
+    # record. Any object with an export(record) method, or a plain callable,
+    # can be installed with add_hook()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: dict[str, dict] = {}
+
+    def export(self, record: StageRecord):
+        with self._lock:
+            stats = self.stages.setdefault(
+                record.stage, {"count": 0, "total": 0.0, "max": 0.0, "last": {}}
+            )
+            stats["count"] += 1
+            stats["total"] += record.duration
+            stats["max"] = max(stats["max"], record.duration)
+            stats["last"] = record.info
+
+
+# Checked before anything else in every instrumented call, so nothing but
+# this lookup happens while no hooks are installed
+enabled = False
+
+_callbacks: list[Callable[[StageRecord], None]] = []
+_contexts: list[Callable[[str], ContextManager]] = []
+_current: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "pybsqr_stage_info", default=None
+)
+
+
+def _update():
+    global enabled
+    enabled = bool(_callbacks or _contexts)
+
+
+def add_hook(hook: Callable[[StageRecord], None]):
+    _callbacks.append(getattr(hook, "export", hook))
+    _update()
+
+
+def remove_hook(hook: Callable[[StageRecord], None]):
+    _callbacks.remove(getattr(hook, "export", hook))
+    _update()
+
+
+def add_context(factory: Callable[[str], ContextManager]):
+    _contexts.append(factory)
+    _update()
+
+
+def remove_context(factory: Callable[[str], ContextManager]):
+    _contexts.remove(factory)
+    _update()
+
+
+def note(**info):
+    current = _current.get()
+    if current is not None:
+        current.update(info)
+
+
+def _run(stage: str, func, args, kwargs):
+    info = {}
+    token = _current.set(info)
+    start = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            for factory in _contexts:
+                stack.enter_context(factory(stage))
+            return func(*args, **kwargs)
+    finally:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        record = StageRecord(stage, duration, info)
+        for callback in _callbacks:
+            callback(record)
+
+
+def instrumented(stage: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            return _run(stage, func, args, kwargs)
+
+        return wrapper
+
+    return decorator
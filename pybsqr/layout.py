@@ -0,0 +1,232 @@
+from typing import NamedTuple
+
+
+NS = "http://www.bysquare.com/bysquare"
+
+PAYMENT_OPTIONS = {"paymentorder": 1, "standingorder": 2, "directdebit": 4}
+PAYMENT_MEANS = {
+    "moneyTransfer": 1,
+    "cash": 2,
+    "cashOnDelivery": 4,
+    "creditCard": 8,
+    "advance": 16,
+    "mutualOffset": 32,
+    "other": 64,
+}
+MONTHS = {
+    month: 2**i
+    for i, month in enumerate(
+        (
+            "January",
+            "February",
+            "March",
+            "April",
+            "May",
+            "June",
+            "July",
+            "August",
+            "September",
+            "October",
+            "November",
+            "December",
+        )
+    )
+}
+PERIODICITY = {
+    "Daily": "d",
+    "Weekly": "w",
+    "Biweekly": "b",
+    "Monthly": "m",
+    "Bimonthly": "B",
+    "Quarterly": "q",
+    "Annually": "a",
+    "Semiannually": "s",
+}
+DIRECT_DEBIT_SCHEME = {"other": "0", "SEPA": "1"}
+DIRECT_DEBIT_TYPE = {"one-off": "0", "recurrent": "1"}
+
+
+# Declarative description of the tab separated field sequence of each
+# bysquare document type, in the order given by bsqr:order in bysquare.xsd.
+
+
+class Field(NamedTuple):
+    tag: str
+    required: bool = False
+    date: bool = False
+    # Either flags (space separated list <-> sum of bits) or an enumeration
+    # (value <-> code)
+    flags: dict | None = None
+    codes: dict | None = None
+    # bsqr:priority of free-text fields that may be shortened to fit a code
+    # into a QR version, the lowest first
+    priority: int | None = None
+    # "decimal", "integer" or "percentage" for the numeric schema types
+    number: str | None = None
+
+
+class Group(NamedTuple):
+    tag: str
+    layout: tuple
+    required: bool = False
+
+
+class Repeated(NamedTuple):
+    tag: str
+    item: str
+    layout: tuple
+
+
+class Extension(NamedTuple):
+    tag: str
+    layout: tuple
+
+
+BANK_ACCOUNT = (
+    Field("IBAN", required=True),
+    Field("BIC"),
+)
+
+STANDING_ORDER_EXT = (
+    Field("Day", number="integer"),
+    Field("Month", flags=MONTHS),
+    Field("Periodicity", required=True, codes=PERIODICITY),
+    Field("LastDate", date=True),
+)
+
+DIRECT_DEBIT_EXT = (
+    Field("DirectDebitScheme", required=True, codes=DIRECT_DEBIT_SCHEME),
+    Field("DirectDebitType", required=True, codes=DIRECT_DEBIT_TYPE),
+    Field("VariableSymbol"),
+    Field("SpecificSymbol"),
+    Field("OriginatorsReferenceInformation", priority=11),
+    Field("MandateID", priority=10),
+    Field("CreditorID", priority=9),
+    Field("ContractID", priority=8),
+    Field("MaxAmount", number="decimal"),
+    Field("ValidTillDate", date=True),
+)
+
+PAYMENT = (
+    Field("PaymentOptions", required=True, flags=PAYMENT_OPTIONS),
+    Field("Amount", number="decimal"),
+    Field("CurrencyCode", required=True),
+    Field("PaymentDueDate", date=True),
+    Field("VariableSymbol"),
+    Field("ConstantSymbol"),
+    Field("SpecificSymbol"),
+    Field("OriginatorsReferenceInformation", priority=12),
+    Field("PaymentNote", priority=1),
+    Repeated("BankAccounts", "BankAccount", BANK_ACCOUNT),
+    Extension("StandingOrderExt", STANDING_ORDER_EXT),
+    Extension("DirectDebitExt", DIRECT_DEBIT_EXT),
+    Field("BeneficiaryName"),
+    Field("BeneficiaryAddressLine1"),
+    Field("BeneficiaryAddressLine2"),
+)
+
+PAY = (
+    Field("InvoiceID", priority=2),
+    Repeated("Payments", "Payment", PAYMENT),
+)
+
+PARTY = (
+    Field("PartyName", required=True, priority=17),
+    Field("CompanyTaxID", priority=20),
+    Field("CompanyVATID", priority=19),
+    Field("CompanyRegisterID", priority=18),
+)
+
+POSTAL_ADDRESS = (
+    Field("StreetName", required=True, priority=12),
+    Field("BuildingNumber", priority=11),
+    Field("CityName", required=True, priority=10),
+    Field("PostalZone", required=True, priority=9),
+    Field("State", priority=6),
+    Field("Country", required=True),
+)
+
+CONTACT = (
+    Field("Name", priority=13),
+    Field("Telephone", priority=14),
+    Field("EMail", priority=15),
+)
+
+SUPPLIER_PARTY = PARTY + (
+    Group("PostalAddress", POSTAL_ADDRESS, required=True),
+    Group("Contact", CONTACT),
+)
+
+CUSTOMER_PARTY = PARTY + (Field("PartyIdentification", priority=16),)
+
+SINGLE_INVOICE_LINE = (
+    Field("OrderLineID", priority=5),
+    Field("DeliveryNoteLineID", priority=4),
+    Field("ItemName", priority=2),
+    Field("ItemEANCode", priority=3),
+    Field("PeriodFromDate", date=True),
+    Field("PeriodToDate", date=True),
+    Field("InvoicedQuantity", required=True, number="decimal"),
+)
+
+TAX_CATEGORY_SUMMARY = (
+    Field("ClassifiedTaxCategory", required=True, number="percentage"),
+    Field("TaxExclusiveAmount", required=True, number="decimal"),
+    Field("TaxAmount", required=True, number="decimal"),
+    Field("AlreadyClaimedTaxExclusiveAmount", required=True, number="decimal"),
+    Field("AlreadyClaimedTaxAmount", required=True, number="decimal"),
+)
+
+MONETARY_SUMMARY = (
+    Field("PayableRoundingAmount", required=True, number="decimal"),
+    Field("PaidDepositsAmount", required=True, number="decimal"),
+)
+
+INVOICE = (
+    Field("InvoiceID", required=True, priority=21),
+    Field("IssueDate", required=True, date=True),
+    Field("TaxPointDate", date=True),
+    Field("OrderID", priority=7),
+    Field("DeliveryNoteID", priority=8),
+    Field("LocalCurrencyCode", required=True),
+    Field("ForeignCurrencyCode"),
+    Field("CurrRate", number="decimal"),
+    Field("ReferenceCurrRate", number="decimal"),
+    Group("SupplierParty", SUPPLIER_PARTY, required=True),
+    Group("CustomerParty", CUSTOMER_PARTY, required=True),
+    Field("NumberOfInvoiceLines", number="integer"),
+    Field("InvoiceDescription", priority=1),
+    Group("SingleInvoiceLine", SINGLE_INVOICE_LINE),
+    Repeated("TaxCategorySummaries", "TaxCategorySummary", TAX_CATEGORY_SUMMARY),
+    Group("MonetarySummary", MONETARY_SUMMARY, required=True),
+)
+
+LAYOUTS = {0x00: ("Pay", PAY), 0x10: ("Invoice", INVOICE)}
+
+
+def _positions(items: tuple, fields: list[str], index: int, found: list) -> int:
+    for item in items:
+        if isinstance(item, Field):
+            found.append((index, item))
+            index += 1
+        elif isinstance(item, Group):
+            index = _positions(item.layout, fields, index, found)
+        elif isinstance(item, Repeated):
+            count = int(fields[index] or 0) if index < len(fields) else 0
+            index += 1
+            for _ in range(count):
+                index = _positions(item.layout, fields, index, found)
+        elif isinstance(item, Extension):
+            present = index < len(fields) and fields[index] == "1"
+            index += 1
+            if present:
+                index = _positions(item.layout, fields, index, found)
+    return index
+
+
+def field_positions(type_: int, fields: list[str]) -> list[tuple[int, Field]]:
+    # Index of every plain field in a field list, counts and extension flags
+    # left out
+    found = []
+    _positions(LAYOUTS[type_][1], fields, 0, found)
+    return found
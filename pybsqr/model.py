@@ -1,156 +1,477 @@
 from datetime import date
 from decimal import Decimal
-from enum import Enum
-from typing import List, Optional
+from typing import Annotated, List, Optional
 
+from lxml import etree, objectify
+from pydantic import Field, StringConstraints, field_validator, model_validator
 from pydantic_xml import BaseXmlModel, RootXmlModel, element
 
+from .base import BySquare as BySquareGenerator
+from .decode import fields_to_xml
+from .invoice import InvoiceBySquare
+from .layout import PAYMENT_MEANS, PAYMENT_OPTIONS
+from .pay import PayBySquare
+
 
 NS_MAP = {
     "": "http://www.bysquare.com/bysquare",
     "xsi": "http://www.w3.org/2001/XMLSchema-instance",
 }
 
+# Simple types of bysquare.xsd, checked by pydantic's compiled validators
+Text = Annotated[
+    str, StringConstraints(pattern=r"^[^\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]*$")
+]
+CurrencyCode = Annotated[str, StringConstraints(pattern=r"^[A-Z]{3}$")]
+IBAN = Annotated[str, StringConstraints(pattern=r"^[A-Z]{2}[0-9]{2}[A-Z0-9]{0,30}$")]
+BIC = Annotated[
+    str, StringConstraints(pattern=r"^[A-Z]{4}[A-Z]{2}[A-Z\d]{2}([A-Z\d]{3})?$")
+]
+VariableSymbol = Annotated[str, StringConstraints(pattern=r"^[0-9]{0,10}$")]
+ConstantSymbol = Annotated[str, StringConstraints(pattern=r"^[0-9]{0,4}$")]
+Percentage = Annotated[Decimal, Field(ge=0, le=1)]
+
+
+def _text(value) -> str:
+    # Field list form of a value, as xml_to_fields reads it from XML
+    if value is None:
+        return ""
+    if isinstance(value, Decimal):
+        return format(value, "f")
+    if isinstance(value, date):
+        return value.isoformat().replace("-", "")
+    return str(value)
+
+
+def _flags(value: str, names: dict, element: str) -> str:
+    unknown = set(value.split()) - names.keys()
+    if unknown or not value.split():
+        raise ValueError(f"{element} must be a list of {', '.join(names)}")
+    return value
+
 
-class PaymentOption(Enum):
-    paymentorder = "paymentorder"
+class _Document:
+    # Absent optional elements are left out of the XML, and the root names
+    # its type, as Pay and Invoice are abstract in the schema
 
-    def __str__(self):
-        return str(2 ** list(PaymentOption).index(self))
+    def to_xml(self, *, exclude_none: bool = True, **kwargs):
+        return super().to_xml(exclude_none=exclude_none, **kwargs)
+
+    def to_xml_tree(self, *, exclude_none: bool = True, **kwargs) -> etree._Element:
+        xml = super().to_xml_tree(exclude_none=exclude_none, **kwargs)
+        xml.set(f"{{{NS_MAP['xsi']}}}type", type(self).__name__)
+        return xml
 
 
 class BankAccount(BaseXmlModel, tag="BankAccount", nsmap=NS_MAP):
-    iban: str = element(tag="IBAN")
-    bic: str = element(tag="BIC", default="")
+    iban: IBAN = element(tag="IBAN")
+    bic: Optional[BIC] = element(tag="BIC", default=None)
+
+    def _fields(self, fields: list[str]):
+        fields.extend((self.iban, _text(self.bic)))
 
 
 class BankAccounts(BaseXmlModel, tag="BankAccounts", nsmap=NS_MAP):
-    bank_account: List[BankAccount]
+    bank_account: List[BankAccount] = Field(min_length=1)
 
 
 class Payment(BaseXmlModel, tag="Payment", nsmap=NS_MAP):
-    payment_options: PaymentOption = element(tag="PaymentOptions")
-    amount: str = element(tag="Amount")
-    currency_code: str = element(tag="CurrencyCode")
-    payment_due_date: date = element(tag="PaymentDueDate")
-    variable_symbol: str = element(tag="VariableSymbol")
-    constang_symbol: str = element(tag="ConstantSymbol")
-    specific_symbol: str = element(tag="SpecificSymbol")
-    originators_reference_information: str = element(
-        tag="OriginatorsReferenceInformation", default=""
-    )
-    payment_note: str = element(tag="PaymentNote")
+    payment_options: str = element(tag="PaymentOptions", default="paymentorder")
+    amount: Optional[Decimal] = element(tag="Amount", default=None)
+    currency_code: CurrencyCode = element(tag="CurrencyCode", default="EUR")
+    payment_due_date: Optional[date] = element(tag="PaymentDueDate", default=None)
+    variable_symbol: Optional[VariableSymbol] = element(
+        tag="VariableSymbol", default=None
+    )
+    constant_symbol: Optional[ConstantSymbol] = element(
+        tag="ConstantSymbol", default=None
+    )
+    specific_symbol: Optional[VariableSymbol] = element(
+        tag="SpecificSymbol", default=None
+    )
+    originators_reference_information: Optional[Text] = element(
+        tag="OriginatorsReferenceInformation", default=None
+    )
+    payment_note: Optional[Text] = element(tag="PaymentNote", default=None)
     bank_accounts: BankAccounts
-    beneficiary_name: str = element(tag="BeneficiaryName")
-    beneficiary_address_line_1: str = element(tag="BeneficiaryAddressLine1")
+    beneficiary_name: Optional[Text] = element(tag="BeneficiaryName", default=None)
+    beneficiary_address_line_1: Optional[Text] = element(
+        tag="BeneficiaryAddressLine1", default=None
+    )
+    beneficiary_address_line_2: Optional[Text] = element(
+        tag="BeneficiaryAddressLine2", default=None
+    )
+
+    @field_validator("payment_options")
+    @classmethod
+    def _check_payment_options(cls, value: str) -> str:
+        return _flags(value, PAYMENT_OPTIONS, "PaymentOptions")
+
+    @model_validator(mode="after")
+    def _check_reference(self):
+        symbols = (self.variable_symbol, self.constant_symbol, self.specific_symbol)
+        if self.originators_reference_information is not None and any(
+            symbol is not None for symbol in symbols
+        ):
+            raise ValueError(
+                "OriginatorsReferenceInformation excludes the payment symbols"
+            )
+        return self
+
+    def _fields(self, fields: list[str]):
+        options = set(self.payment_options.split())
+        fields.append(str(sum(PAYMENT_OPTIONS[option] for option in options)))
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.amount,
+                    self.currency_code,
+                    self.payment_due_date,
+                    self.variable_symbol,
+                    self.constant_symbol,
+                    self.specific_symbol,
+                    self.originators_reference_information,
+                    self.payment_note,
+                ),
+            )
+        )
+        fields.append(str(len(self.bank_accounts.bank_account)))
+        for account in self.bank_accounts.bank_account:
+            account._fields(fields)
+        # Standing order and direct debit extensions are not encoded yet
+        fields.extend(("0", "0"))
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.beneficiary_name,
+                    self.beneficiary_address_line_1,
+                    self.beneficiary_address_line_2,
+                ),
+            )
+        )
 
 
 class Payments(BaseXmlModel, tag="Payments", nsmap=NS_MAP):
-    payment: list[Payment]
+    payment: list[Payment] = Field(min_length=1)
 
 
-class Pay(BaseXmlModel, tag="Pay", nsmap=NS_MAP):
-    invoice_id: str = element(tag="InvoiceID", default="")
+class Pay(_Document, BaseXmlModel, tag="Pay", nsmap=NS_MAP):
+    invoice_id: Optional[Text] = element(tag="InvoiceID", default=None)
     payments: Payments
 
+    def to_fields(self) -> list[str]:
+        fields = [_text(self.invoice_id), str(len(self.payments.payment))]
+        for payment in self.payments.payment:
+            payment._fields(fields)
+        return fields
+
+    def to_generator(self) -> PayBySquare:
+        return _generator(PayBySquare, self.to_fields())
+
 
 class PostalAddress(BaseXmlModel, tag="PostalAddress", nsmap=NS_MAP):
-    street_name: str = element(tag="StreetName")
-    bulding_number: str = element(tag="BuildingNumber", default="")
-    city_name: str = element(tag="CityName")
-    postal_zone: str = element(tag="PostalZone")
-    country: str = element(tag="Country")
+    street_name: Text = element(tag="StreetName")
+    building_number: Optional[Text] = element(tag="BuildingNumber", default=None)
+    city_name: Text = element(tag="CityName")
+    postal_zone: Text = element(tag="PostalZone")
+    state: Optional[Text] = element(tag="State", default=None)
+    country: CurrencyCode = element(tag="Country")
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.street_name,
+                    self.building_number,
+                    self.city_name,
+                    self.postal_zone,
+                    self.state,
+                    self.country,
+                ),
+            )
+        )
 
 
 class Contact(BaseXmlModel, tag="Contact", nsmap=NS_MAP):
-    name: str = element(tag="Name", default="")
-    telephone: str = element(tag="Telephone", default="")
-    email: str = element(tag="EMail", default="")
+    name: Optional[Text] = element(tag="Name", default=None)
+    telephone: Optional[Text] = element(tag="Telephone", default=None)
+    email: Optional[Text] = element(tag="EMail", default=None)
+
+    def _fields(self, fields: list[str]):
+        fields.extend(map(_text, (self.name, self.telephone, self.email)))
 
 
 class SupplierParty(BaseXmlModel, tag="SupplierParty", nsmap=NS_MAP):
-    party_name: str = element(tag="PartyName")
-    company_tax_id: str = element(tag="CompanyTaxID", default="")
-    company_vat_id: str = element(tag="CompanyVATID", default="")
-    company_register_id: str = element(tag="CompanyRegisterID", default="")
+    party_name: Text = element(tag="PartyName")
+    company_tax_id: Optional[Text] = element(tag="CompanyTaxID", default=None)
+    company_vat_id: Optional[Text] = element(tag="CompanyVATID", default=None)
+    company_register_id: Optional[Text] = element(tag="CompanyRegisterID", default=None)
     postal_address: PostalAddress
-    contact: Contact
+    contact: Optional[Contact] = None
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.party_name,
+                    self.company_tax_id,
+                    self.company_vat_id,
+                    self.company_register_id,
+                ),
+            )
+        )
+        self.postal_address._fields(fields)
+        (self.contact or Contact())._fields(fields)
 
 
 class CustomerParty(BaseXmlModel, tag="CustomerParty", nsmap=NS_MAP):
-    party_name: str = element(tag="PartyName")
-    company_tax_id: str = element(tag="CompanyTaxID", default="")
-    company_vat_id: str = element(tag="CompanyVATID", default="")
-    company_register_id: str = element(tag="CompanyRegisterID", default="")
-    party_identification: str = element(tag="PartyIdentification", default="")
+    party_name: Text = element(tag="PartyName")
+    company_tax_id: Optional[Text] = element(tag="CompanyTaxID", default=None)
+    company_vat_id: Optional[Text] = element(tag="CompanyVATID", default=None)
+    company_register_id: Optional[Text] = element(tag="CompanyRegisterID", default=None)
+    party_identification: Optional[Text] = element(
+        tag="PartyIdentification", default=None
+    )
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.party_name,
+                    self.company_tax_id,
+                    self.company_vat_id,
+                    self.company_register_id,
+                    self.party_identification,
+                ),
+            )
+        )
 
 
 class SingleInvoiceLine(BaseXmlModel, tag="SingleInvoiceLine", nsmap=NS_MAP):
-    order_line_id: str = element(tag="OrderLineID", default="")
-    delivery_note_line_id: str = element(tag="DeliveryNoteLineID", default="")
-    item_name: str = element(tag="ItemName")
+    order_line_id: Optional[Text] = element(tag="OrderLineID", default=None)
+    delivery_note_line_id: Optional[Text] = element(
+        tag="DeliveryNoteLineID", default=None
+    )
+    item_name: Optional[Text] = element(tag="ItemName", default=None)
+    item_ean_code: Optional[Text] = element(tag="ItemEANCode", default=None)
+    period_from_date: Optional[date] = element(tag="PeriodFromDate", default=None)
+    period_to_date: Optional[date] = element(tag="PeriodToDate", default=None)
     invoiced_quantity: Decimal = element(tag="InvoicedQuantity")
-    unit_price_tax_exclusive_amount: Decimal | str = element(
-        tag="UnitPriceTaxExclusiveAmount", default=""
+    unit_price_tax_exclusive_amount: Optional[Decimal] = element(
+        tag="UnitPriceTaxExclusiveAmount", default=None
     )
-    unit_price_tax_inclusive_amount: Decimal | str = element(
-        tag="UnitPriceTaxInclusiveAmount", default=""
+    unit_price_tax_inclusive_amount: Optional[Decimal] = element(
+        tag="UnitPriceTaxInclusiveAmount", default=None
     )
-    unit_price_tax_amount: Decimal | str = element(tag="UnitPriceTaxAmount", default="")
+    unit_price_tax_amount: Optional[Decimal] = element(
+        tag="UnitPriceTaxAmount", default=None
+    )
+
+    @model_validator(mode="after")
+    def _check_choices(self):
+        if (self.item_name is None) == (self.item_ean_code is None):
+            raise ValueError("Exactly one of ItemName and ItemEANCode is required")
+        if (self.period_from_date is None) != (self.period_to_date is None):
+            raise ValueError("PeriodFromDate and PeriodToDate go together")
+        return self
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.order_line_id,
+                    self.delivery_note_line_id,
+                    self.item_name,
+                    self.item_ean_code,
+                    self.period_from_date,
+                    self.period_to_date,
+                    self.invoiced_quantity,
+                ),
+            )
+        )
 
 
 class TaxCategorySummary(BaseXmlModel, tag="TaxCategorySummary", nsmap=NS_MAP):
-    classified_tax_category: Decimal = element(tag="ClassifiedTaxCategory")
+    classified_tax_category: Percentage = element(tag="ClassifiedTaxCategory")
     tax_exclusive_amount: Decimal = element(tag="TaxExclusiveAmount")
-    tax_inclusive_amount: Decimal | str = element(tag="TaxInclusiveAmount", default="")
+    tax_inclusive_amount: Optional[Decimal] = element(
+        tag="TaxInclusiveAmount", default=None
+    )
     tax_amount: Decimal = element(tag="TaxAmount")
     already_claimed_tax_exclusive_amount: Decimal = element(
-        tag="AlreadyClaimedTaxExclusiveAmount"
+        tag="AlreadyClaimedTaxExclusiveAmount", default=Decimal(0)
     )
-    already_claimed_tax_inclusive_amount: Decimal | str = element(
-        tag="AlreadyClaimedTaxInclusiveAmount", default=""
+    already_claimed_tax_inclusive_amount: Optional[Decimal] = element(
+        tag="AlreadyClaimedTaxInclusiveAmount", default=None
     )
-    already_claimed_tax_amount: Decimal = element(tag="AlreadyClaimedTaxAmount")
-    difference_tax_exclusive_amount: Decimal | str = element(
-        tag="DifferenceTaxExclusiveAmount", default=""
+    already_claimed_tax_amount: Decimal = element(
+        tag="AlreadyClaimedTaxAmount", default=Decimal(0)
     )
-    difference_tax_inclusive_amount: Decimal | str = element(
-        tag="DifferenceTaxInclusiveAmount", default=""
+    difference_tax_exclusive_amount: Optional[Decimal] = element(
+        tag="DifferenceTaxExclusiveAmount", default=None
     )
-    difference_tax_amount: Decimal | str = element(
-        tag="DifferenceTaxAmount", default=""
+    difference_tax_inclusive_amount: Optional[Decimal] = element(
+        tag="DifferenceTaxInclusiveAmount", default=None
     )
+    difference_tax_amount: Optional[Decimal] = element(
+        tag="DifferenceTaxAmount", default=None
+    )
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(
+                _text,
+                (
+                    self.classified_tax_category,
+                    self.tax_exclusive_amount,
+                    self.tax_amount,
+                    self.already_claimed_tax_exclusive_amount,
+                    self.already_claimed_tax_amount,
+                ),
+            )
+        )
 
 
 class TaxCategorySummaries(BaseXmlModel, tag="TaxCategorySummaries", nsmap=NS_MAP):
-    tax_category_summary: list[TaxCategorySummary]
+    tax_category_summary: list[TaxCategorySummary] = Field(min_length=1)
 
 
 class MonetarySummary(BaseXmlModel, tag="MonetarySummary", nsmap=NS_MAP):
-    # tax_exclusive_amount: Decimal | str = element(tag='TaxExclusiveAmount', default='')
-    # tax_inclusive_amount: Decimal | str = element(tag='TaxInclusiveAmount', default='')
-    # tax_amount: Decimal | str = element(tag='TaxAmount', default='')
-    payable_rounding_amount: Decimal = element(tag="PayableRoundingAmount")
-    paid_deposits_amount: Decimal = element(tag="PaidDepositsAmount")
-    # payable_amount: Decimal | str = element(tag='PayableAmount', default='')
+    payable_rounding_amount: Decimal = element(
+        tag="PayableRoundingAmount", default=Decimal(0)
+    )
+    paid_deposits_amount: Decimal = element(
+        tag="PaidDepositsAmount", default=Decimal(0)
+    )
+
+    def _fields(self, fields: list[str]):
+        fields.extend(
+            map(_text, (self.payable_rounding_amount, self.paid_deposits_amount))
+        )
 
 
-class Invoice(BaseXmlModel, tag="Invoice", nsmap=NS_MAP):
-    invoice_id: str = element(tag="InvoiceID", default="")
+class Invoice(_Document, BaseXmlModel, tag="Invoice", nsmap=NS_MAP):
+    invoice_id: Text = element(tag="InvoiceID")
     issue_date: date = element(tag="IssueDate")
-    tax_point_date: date = element(tag="TaxPointDate", default="")
-    order_id: str = element(tag="OrderID", default="")
-    delivery_note_id: str = element(tag="DeliverryNoteID", default="")
-    local_currency_code: str = element(tag="LocalCurrencyCode")
+    tax_point_date: Optional[date] = element(tag="TaxPointDate", default=None)
+    order_id: Optional[Text] = element(tag="OrderID", default=None)
+    delivery_note_id: Optional[Text] = element(tag="DeliveryNoteID", default=None)
+    local_currency_code: CurrencyCode = element(tag="LocalCurrencyCode", default="EUR")
+    foreign_currency_code: Optional[CurrencyCode] = element(
+        tag="ForeignCurrencyCode", default=None
+    )
+    curr_rate: Optional[Decimal] = element(tag="CurrRate", default=None)
+    reference_curr_rate: Optional[Decimal] = element(
+        tag="ReferenceCurrRate", default=None
+    )
     supplier_party: SupplierParty
     customer_party: CustomerParty
-    # number_of_invoice_lines: Optional[int] = element(tag='NumberOfInvoiceLines')
-    # invoice_description: Optional[str] = element(tag='InvoiceDescription')
-    single_invoice_line: SingleInvoiceLine
+    number_of_invoice_lines: Optional[int] = element(
+        tag="NumberOfInvoiceLines", default=None
+    )
+    invoice_description: Optional[Text] = element(
+        tag="InvoiceDescription", default=None
+    )
+    single_invoice_line: Optional[SingleInvoiceLine] = None
     tax_category_summaries: TaxCategorySummaries
     monetary_summary: MonetarySummary
-    payment_means: str = element(tag="PaymentMeans")
+    payment_means: Optional[str] = element(tag="PaymentMeans", default=None)
+
+    @field_validator("payment_means")
+    @classmethod
+    def _check_payment_means(cls, value: str | None) -> str | None:
+        return value if value is None else _flags(value, PAYMENT_MEANS, "PaymentMeans")
+
+    @model_validator(mode="after")
+    def _check_choices(self):
+        rates = (self.foreign_currency_code, self.curr_rate, self.reference_curr_rate)
+        if any(rate is not None for rate in rates) and None in rates:
+            raise ValueError(
+                "ForeignCurrencyCode, CurrRate and ReferenceCurrRate go together"
+            )
+        if (self.number_of_invoice_lines is None) == (self.single_invoice_line is None):
+            raise ValueError(
+                "Exactly one of NumberOfInvoiceLines and SingleInvoiceLine is required"
+            )
+        if (
+            self.invoice_description is not None
+            and self.number_of_invoice_lines is None
+        ):
+            raise ValueError("InvoiceDescription requires NumberOfInvoiceLines")
+        return self
+
+    def to_fields(self) -> list[str]:
+        fields = list(
+            map(
+                _text,
+                (
+                    self.invoice_id,
+                    self.issue_date,
+                    self.tax_point_date,
+                    self.order_id,
+                    self.delivery_note_id,
+                    self.local_currency_code,
+                    self.foreign_currency_code,
+                    self.curr_rate,
+                    self.reference_curr_rate,
+                ),
+            )
+        )
+        self.supplier_party._fields(fields)
+        self.customer_party._fields(fields)
+        fields.append(_text(self.number_of_invoice_lines))
+        fields.append(_text(self.invoice_description))
+        if self.single_invoice_line is None:
+            fields.extend([""] * 7)
+        else:
+            self.single_invoice_line._fields(fields)
+        summaries = self.tax_category_summaries.tax_category_summary
+        fields.append(str(len(summaries)))
+        for summary in summaries:
+            summary._fields(fields)
+        self.monetary_summary._fields(fields)
+        return fields
+
+    def to_generator(self) -> InvoiceBySquare:
+        return _generator(InvoiceBySquare, self.to_fields())
 
 
 class BySquare(RootXmlModel):
     root: Pay | Invoice
+
+
+MODELS = {"pay": Pay, "invoice": Invoice}
+
+
+def _generator(cls: type[BySquareGenerator], fields: list[str]):
+    # The validated model maps straight to the field list, the XML is only
+    # built if somebody asks for it
+    return cls(
+        fields=fields,
+        xml_factory=lambda: objectify.fromstring(
+            etree.tostring(fields_to_xml(cls.bysquare_type, fields))
+        ),
+    )
+
+
+def from_data(kind: str | None, data: dict | str | bytes) -> Pay | Invoice:
+    # data is a dict or a JSON document keyed by the model's field names.
+    # Without a kind, whichever of Pay and Invoice validates is taken.
+    model = BySquare if kind is None else MODELS[kind]
+    if isinstance(data, (str, bytes)):
+        document = model.model_validate_json(data)
+    else:
+        document = model.model_validate(data)
+    return document.root if kind is None else document
+
+
+def generator_from_data(
+    kind: str | None, data: dict | str | bytes
+) -> BySquareGenerator:
+    return from_data(kind, data).to_generator()
@@ -0,0 +1,121 @@
+import functools
+from bisect import bisect_left
+from typing import NamedTuple
+
+from .instrument import instrumented
+
+
+# Values of qrcode.constants.ERROR_CORRECT_*, spelled out so sizing codes
+# does not need to import qrcode
+ERROR_CORRECTION = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+
+class DataOverflowError(ValueError):
+    pass
+
+
+# Character count indicator sizes of alphanumeric segments, by version range
+_COUNT_BITS = ((1, 9), (10, 11), (27, 13))
+
+
+def alphanumeric_bits(length: int, count_bits: int) -> int:
+    # Mode indicator, character count, 11 bits per pair and 6 for an odd one
+    return 4 + count_bits + 11 * (length // 2) + 6 * (length % 2)
+
+
+def min_version(length: int, error_correction: str = "M") -> int:
+    # BySquare codes are base32hex (0-9, A-V), which is always valid
+    # alphanumeric data, so the version follows from the length alone
+    from qrcode import util
+
+    if error_correction not in ERROR_CORRECTION:
+        raise ValueError(f"Unsupported error correction {error_correction!r}")
+    limits = util.BIT_LIMIT_TABLE[ERROR_CORRECTION[error_correction]]
+    for i, (first, count_bits) in enumerate(_COUNT_BITS):
+        last = _COUNT_BITS[i + 1][0] - 1 if i + 1 < len(_COUNT_BITS) else 40
+        version = bisect_left(
+            limits, alphanumeric_bits(length, count_bits), first, last + 1
+        )
+        if version <= last:
+            return version
+    raise DataOverflowError(
+        f"Code of {length} characters does not fit into a QR code"
+        f" with error correction {error_correction}"
+    )
+
+
+def make_qr(
+    code: str,
+    error_correction: str = "M",
+    box_size: int = 10,
+    border: int = 4,
+    image_factory=None,
+) -> "QRCode":
+    from qrcode import QRCode, util
+
+    qr = QRCode(
+        version=min_version(len(code), error_correction),
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+        image_factory=image_factory,
+    )
+    qr.add_data(util.QRData(code, mode=util.MODE_ALPHA_NUM))
+    qr.make(fit=False)
+    return qr
+
+
+# Maps the characters of a binary string to the 0/1 bytes renderers scan
+_BITS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+class QRMatrix(NamedTuple):
+    # Module matrix without the quiet zone, packed row by row most significant
+    # bit first with dark modules set and every row padded to whole bytes
+    version: int
+    size: int
+    data: bytes
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.size + 7) // 8
+
+    def is_dark(self, x: int, y: int) -> bool:
+        return bool(self.data[y * self.row_bytes + x // 8] & (0x80 >> x % 8))
+
+    def rows(self, border: int = 0) -> list[bytes]:
+        # One 0/1 byte per module, quiet zone included
+        row_bytes = self.row_bytes
+        pad = row_bytes * 8 - self.size
+        edge = "0" * border
+        rows = [bytes(self.size + 2 * border)] * border
+        for start in range(0, len(self.data), row_bytes):
+            value = int.from_bytes(self.data[start : start + row_bytes], "big")
+            bits = f"{edge}{value >> pad:0{self.size}b}{edge}"
+            rows.append(bits.encode().translate(_BITS))
+        rows.extend([bytes(self.size + 2 * border)] * border)
+        return rows
+
+    def to_list(self, border: int = 0) -> list[list[bool]]:
+        return [list(map(bool, row)) for row in self.rows(border)]
+
+
+@instrumented("qr_matrix")
+def _make_matrix(code: str, error_correction: str) -> QRMatrix:
+    qr = make_qr(code, error_correction, border=0)
+    size = qr.modules_count
+    row_bytes = (size + 7) // 8
+    pad = row_bytes * 8 - size
+    data = b"".join(
+        (int("".join("1" if module else "0" for module in row), 2) << pad).to_bytes(
+            row_bytes, "big"
+        )
+        for row in qr.modules
+    )
+    return QRMatrix(qr.version, size, data)
+
+
+@functools.lru_cache(maxsize=256)
+def qr_matrix(code: str, error_correction: str = "M") -> QRMatrix:
+    # Rendering one code to several formats or sizes fits the QR code once
+    return _make_matrix(code, error_correction)
@@ -0,0 +1,315 @@
+import sys
+from typing import Iterator
+
+from lxml import etree, objectify
+
+from . import layout
+from .base import BySquare
+from .decode import fields_to_xml
+from .invoice import InvoiceBySquare
+from .pay import PayBySquare
+from .xml import get_generator
+
+
+# Plain records holding a document in the encoded form of its field list
+# (dates as YYYYMMDD, flags as sums of bits), structured like the XML. They
+# keep no lxml tree, so large numbers of documents can stay in memory.
+
+
+class Record:
+
+    __slots__ = ()
+    layout: tuple = ()
+    # Record classes of the Group, Repeated and Extension items, by tag
+    records: dict = {}
+
+    def __init__(self, *args, **kwargs):
+        for item, name in zip(self.layout, self.__slots__):
+            if isinstance(item, layout.Field):
+                default = ""
+            elif isinstance(item, layout.Repeated):
+                default = ()
+            else:
+                default = None
+            setattr(self, name, default)
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def _read(cls, fields: Iterator[str]) -> "Record":
+        record = cls.__new__(cls)
+        empty = True
+        for item, name in zip(cls.layout, cls.__slots__):
+            if isinstance(item, layout.Field):
+                # Currencies, countries, dates or supplier details repeat
+                # across documents, interning stores each of them once
+                value = sys.intern(str(next(fields, "")))
+                empty = empty and not value
+            elif isinstance(item, layout.Group):
+                value = cls.records[item.tag]._read(fields)
+                if value is None and item.required:
+                    value = cls.records[item.tag]()
+                empty = empty and value is None
+            elif isinstance(item, layout.Repeated):
+                count = int(next(fields, "") or 0)
+                value = tuple(
+                    cls.records[item.tag]._read_item(fields) for _ in range(count)
+                )
+                empty = empty and not value
+            else:
+                value = None
+                if next(fields, "0") == "1":
+                    value = cls.records[item.tag]._read_item(fields)
+                    empty = False
+            setattr(record, name, value)
+        # Optional groups whose fields are all empty are left out, as in XML
+        return None if empty else record
+
+    @classmethod
+    def _read_item(cls, fields: Iterator[str]) -> "Record":
+        return cls._read(fields) or cls()
+
+    def _write(self, fields: list[str]):
+        for item, name in zip(self.layout, self.__slots__):
+            value = getattr(self, name)
+            if isinstance(item, layout.Field):
+                fields.append(str(value))
+            elif isinstance(item, layout.Group):
+                if value is None:
+                    value = self.records[item.tag]()
+                value._write(fields)
+            elif isinstance(item, layout.Repeated):
+                fields.append(str(len(value)))
+                for record in value:
+                    record._write(fields)
+            elif value is None:
+                fields.append("0")
+            else:
+                fields.append("1")
+                value._write(fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __hash__(self):
+        # Equal records hash equally, so a day's records can be deduplicated
+        # with a set. Records must not be changed while they are in one.
+        return hash(
+            (type(self),)
+            + tuple(
+                tuple(value) if isinstance(value, list) else value
+                for value in map(self.__getattribute__, self.__slots__)
+            )
+        )
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class BankAccount(Record):
+    __slots__ = ("iban", "bic")
+    layout = layout.BANK_ACCOUNT
+
+
+class StandingOrder(Record):
+    __slots__ = ("day", "month", "periodicity", "last_date")
+    layout = layout.STANDING_ORDER_EXT
+
+
+class DirectDebit(Record):
+    __slots__ = (
+        "direct_debit_scheme",
+        "direct_debit_type",
+        "variable_symbol",
+        "specific_symbol",
+        "originators_reference_information",
+        "mandate_id",
+        "creditor_id",
+        "contract_id",
+        "max_amount",
+        "valid_till_date",
+    )
+    layout = layout.DIRECT_DEBIT_EXT
+
+
+class Payment(Record):
+    __slots__ = (
+        "payment_options",
+        "amount",
+        "currency_code",
+        "payment_due_date",
+        "variable_symbol",
+        "constant_symbol",
+        "specific_symbol",
+        "originators_reference_information",
+        "payment_note",
+        "bank_accounts",
+        "standing_order",
+        "direct_debit",
+        "beneficiary_name",
+        "beneficiary_address_line1",
+        "beneficiary_address_line2",
+    )
+    layout = layout.PAYMENT
+    records = {
+        "BankAccounts": BankAccount,
+        "StandingOrderExt": StandingOrder,
+        "DirectDebitExt": DirectDebit,
+    }
+
+
+class PostalAddress(Record):
+    __slots__ = (
+        "street_name",
+        "building_number",
+        "city_name",
+        "postal_zone",
+        "state",
+        "country",
+    )
+    layout = layout.POSTAL_ADDRESS
+
+
+class Contact(Record):
+    __slots__ = ("name", "telephone", "email")
+    layout = layout.CONTACT
+
+
+class SupplierParty(Record):
+    __slots__ = (
+        "party_name",
+        "company_tax_id",
+        "company_vat_id",
+        "company_register_id",
+        "postal_address",
+        "contact",
+    )
+    layout = layout.SUPPLIER_PARTY
+    records = {"PostalAddress": PostalAddress, "Contact": Contact}
+
+
+class CustomerParty(Record):
+    __slots__ = (
+        "party_name",
+        "company_tax_id",
+        "company_vat_id",
+        "company_register_id",
+        "party_identification",
+    )
+    layout = layout.CUSTOMER_PARTY
+
+
+class SingleInvoiceLine(Record):
+    __slots__ = (
+        "order_line_id",
+        "delivery_note_line_id",
+        "item_name",
+        "item_ean_code",
+        "period_from_date",
+        "period_to_date",
+        "invoiced_quantity",
+    )
+    layout = layout.SINGLE_INVOICE_LINE
+
+
+class TaxCategorySummary(Record):
+    __slots__ = (
+        "classified_tax_category",
+        "tax_exclusive_amount",
+        "tax_amount",
+        "already_claimed_tax_exclusive_amount",
+        "already_claimed_tax_amount",
+    )
+    layout = layout.TAX_CATEGORY_SUMMARY
+
+
+class MonetarySummary(Record):
+    __slots__ = ("payable_rounding_amount", "paid_deposits_amount")
+    layout = layout.MONETARY_SUMMARY
+
+
+class Document(Record):
+
+    __slots__ = ()
+    generator: type[BySquare]
+
+    @classmethod
+    def from_fields(cls, fields: list[str]) -> "Document":
+        return cls._read_item(iter(fields))
+
+    @classmethod
+    def from_xml(cls, xml) -> "Document":
+        # Strings and bytes are validated against the schema like any other
+        # input, parsed elements are taken as they are
+        if isinstance(xml, (str, bytes)):
+            generator = get_generator(xml)
+            if not isinstance(generator, cls.generator):
+                raise ValueError(f"Document is not {cls.__name__}")
+            return cls.from_fields(generator.fields)
+        return cls.from_fields(cls.generator().xml_to_fields(xml))
+
+    def to_fields(self) -> list[str]:
+        fields = []
+        self._write(fields)
+        return fields
+
+    def to_xml(self) -> etree._Element:
+        return fields_to_xml(self.generator.bysquare_type, self.to_fields())
+
+    def to_generator(self) -> BySquare:
+        fields = self.to_fields()
+        return self.generator(
+            fields=fields,
+            xml_factory=lambda: objectify.fromstring(etree.tostring(self.to_xml())),
+        )
+
+
+class Pay(Document):
+    __slots__ = ("invoice_id", "payments")
+    layout = layout.PAY
+    records = {"Payments": Payment}
+    generator = PayBySquare
+
+
+class Invoice(Document):
+    __slots__ = (
+        "invoice_id",
+        "issue_date",
+        "tax_point_date",
+        "order_id",
+        "delivery_note_id",
+        "local_currency_code",
+        "foreign_currency_code",
+        "curr_rate",
+        "reference_curr_rate",
+        "supplier_party",
+        "customer_party",
+        "number_of_invoice_lines",
+        "invoice_description",
+        "single_invoice_line",
+        "tax_category_summaries",
+        "monetary_summary",
+    )
+    layout = layout.INVOICE
+    records = {
+        "SupplierParty": SupplierParty,
+        "CustomerParty": CustomerParty,
+        "SingleInvoiceLine": SingleInvoiceLine,
+        "TaxCategorySummaries": TaxCategorySummary,
+        "MonetarySummary": MonetarySummary,
+    }
+    generator = InvoiceBySquare
+
+
+DOCUMENTS = {Pay.generator.bysquare_type: Pay, Invoice.generator.bysquare_type: Invoice}
+
+
+def from_generator(generator: BySquare) -> Document:
+    return DOCUMENTS[generator.bysquare_type].from_fields(generator.fields)
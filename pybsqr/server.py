@@ -0,0 +1,413 @@
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from lxml import etree
+from qrcode.exceptions import DataOverflowError
+
+from . import base
+from .base import FORMATS
+from .batch import _chunked, _process_chunk, code_for, generator_for
+from .cache import ResultCache, set_cache
+from .cli import _record
+from .xml import warmup
+
+
+FRAMES = ("pay_by_square_frame", "invoice_by_square_frame")
+# Errors caused by the request rather than by the server
+CLIENT_ERRORS = (ValueError, TypeError, KeyError, etree.Error, DataOverflowError)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class InvalidDocument(ValueError):
+    pass
+
+
+def _warmup(cache: bool):
+    # Compiles the schema and decodes the frames once per worker, so requests
+    # only pay for their own document
+    warmup()
+    if cache:
+        set_cache(ResultCache())
+    for frame in FRAMES:
+        base._load_svg_frame(frame)
+        try:
+            base._load_frame(frame)
+        except ImportError:
+            pass
+
+
+def _code(item, max_version: int | None, fit: str, truncate: list | None) -> str:
+    return code_for(item, None, max_version, fit, truncate)
+
+
+def _image(item, frame: bool, format: str, options: dict) -> bytes:
+    return generator_for(item).generate_qr(
+        frame=frame, format=format, output=bytes, **options
+    )
+
+
+def _call(func, *args) -> tuple:
+    # lxml exceptions cannot be pickled, so workers hand back invalid input
+    # as a message, like batch results do
+    try:
+        return func(*args), None
+    except CLIENT_ERRORS as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+class Service:
+    # Worker pool behind the server. At most max_pending requests are admitted
+    # at a time, running or queued for a worker; further ones wait up to
+    # queue_timeout seconds for a slot and are then turned away.
+
+    def __init__(
+        self,
+        jobs: int | None = None,
+        executor: str = "process",
+        max_pending: int | None = None,
+        queue_timeout: float = 1.0,
+        chunksize: int = 16,
+        cache: bool = False,
+    ):
+        self.jobs = jobs or os.cpu_count() or 1
+        if executor == "process":
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.jobs, initializer=_warmup, initargs=(cache,)
+            )
+        elif executor == "thread":
+            _warmup(cache)
+            self.pool = ThreadPoolExecutor(max_workers=self.jobs)
+        else:
+            raise ValueError(f"Unknown executor {executor!r}")
+        self.max_pending = max_pending or self.jobs * 4
+        self.queue_timeout = queue_timeout
+        self.chunksize = chunksize
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def start(self):
+        # Starts the workers before the first request arrives
+        for future in [self.pool.submit(int) for _ in range(self.jobs)]:
+            future.result()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @contextlib.contextmanager
+    def admit(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise Overloaded(f"{self.max_pending} requests are already pending")
+        with self._lock:
+            self._pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _run(self, func, *args):
+        result, error = self.pool.submit(_call, func, *args).result()
+        if error is not None:
+            raise InvalidDocument(error)
+        return result
+
+    def code(
+        self,
+        item,
+        max_version: int | None = None,
+        fit: str = "reject",
+        truncate: list | None = None,
+    ) -> str:
+        return self._run(_code, item, max_version, fit, truncate)
+
+    def image(self, item, frame: bool, format: str, options: dict) -> bytes:
+        return self._run(_image, item, frame, format, options)
+
+    def codes(
+        self,
+        items: list,
+        max_version: int | None = None,
+        fit: str = "reject",
+        truncate: list | None = None,
+    ) -> list:
+        # items are (index, item) pairs, spread over the workers in chunks.
+        # A batch holds a single admission slot, so it keeps at most one
+        # chunk per worker in flight to leave room for other requests.
+        results = []
+        pending = deque()
+        try:
+            for chunk in _chunked(items, self.chunksize):
+                if len(pending) >= self.jobs:
+                    results.extend(pending.popleft().result())
+                pending.append(
+                    self.pool.submit(
+                        _process_chunk, chunk, None, max_version, fit, truncate
+                    )
+                )
+            while pending:
+                results.extend(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+        return results
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def _item(record, index: int = 0) -> tuple[str, object]:
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    name, item = _record(record, index)
+    if "file" in record:
+        raise ValueError("File records are not accepted by the server")
+    return name, item
+
+
+def _fit(query: dict) -> tuple:
+    # max_version, fit and the comma separated tags of truncatable fields
+    max_version = query.get("max_version")
+    truncate = query.get("truncate")
+    return (
+        int(max_version) if max_version else None,
+        query.get("fit", "reject"),
+        truncate.split(",") if truncate else None,
+    )
+
+
+def _flag(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean {value!r}")
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    # HTTP/1.1 keeps connections alive between requests
+    protocol_version = "HTTP/1.1"
+    server_version = "pybsqr"
+    max_body = 2**20
+
+    def address_string(self) -> str:
+        # Clients of Unix sockets have no address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, content_type: str, body: bytes, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data, headers=()):
+        self._send(status, "application/json", json.dumps(data).encode(), headers)
+
+    def _send_error(self, status: int, message: str, headers=()):
+        self._send_json(status, {"error": message}, headers)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            return self._send_error(404, f"Unknown path {self.path}")
+        service = self.server.service
+        self._send_json(
+            200,
+            {
+                "status": "ok",
+                "jobs": service.jobs,
+                "pending": service.pending,
+                "max_pending": service.max_pending,
+            },
+        )
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        endpoint = {"/code": self._code, "/image": self._image, "/batch": self._batch}
+        length = self.headers.get("Content-Length")
+        # Unless the body is read, the connection cannot be reused
+        if url.path not in endpoint:
+            self.close_connection = True
+            return self._send_error(404, f"Unknown path {url.path}")
+        if length is None:
+            self.close_connection = True
+            return self._send_error(411, "Content-Length is required")
+        length = int(length)
+        if length > self.max_body:
+            self.close_connection = True
+            return self._send_error(413, f"Body exceeds {self.max_body} bytes")
+        body = self.rfile.read(length)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            with self.server.service.admit():
+                endpoint[url.path](body, query)
+        except Overloaded as e:
+            self._send_error(503, str(e), [("Retry-After", "1")])
+        except InvalidDocument as e:
+            self._send_error(400, str(e))
+        except CLIENT_ERRORS as e:
+            self._send_error(400, f"{type(e).__name__}: {e}")
+        except Exception as e:
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    def _document(self, body: bytes):
+        # Either a Pay or Invoice XML document or a JSON record as in batch
+        # manifests: {"xml": ...}, {"kind": ..., "fields": [...]} or
+        # {"kind": ..., "data": {...}}
+        if body.lstrip().startswith(b"{"):
+            return _item(json.loads(body))[1]
+        return body
+
+    def _code(self, body: bytes, query: dict):
+        code = self.server.service.code(self._document(body), *_fit(query))
+        self._send(200, "text/plain; charset=utf-8", code.encode())
+
+    def _image(self, body: bytes, query: dict):
+        format = query.get("format", "PNG").upper()
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format {format!r}")
+        options = {
+            "error_correction": query.get("error_correction", "M"),
+            "box_size": int(query.get("box_size", 10)),
+            "border": int(query.get("border", 4)),
+        }
+        for name in ("size", "colors", "compress_level"):
+            if name in query:
+                options[name] = int(query[name])
+        image = self.server.service.image(
+            self._document(body), _flag(query.get("frame", "1")), format, options
+        )
+        self._send(200, FORMATS[format], image)
+
+    def _batch(self, body: bytes, query: dict):
+        # A JSON array of records, answered with one result per record
+        records = json.loads(body)
+        if not isinstance(records, list):
+            raise ValueError("Batch must be a JSON array of records")
+        results, items = [], []
+        for index, record in enumerate(records):
+            try:
+                name, item = _item(record, index)
+            except CLIENT_ERRORS as e:
+                results.append(
+                    {"name": f"{index:06d}", "error": f"{type(e).__name__}: {e}"}
+                )
+            else:
+                results.append({"name": name})
+                items.append((index, item))
+        for result in self.server.service.codes(items, *_fit(query)):
+            if result.error is None:
+                results[result.index]["code"] = result.code
+            else:
+                results[result.index]["error"] = result.error
+        self._send_json(200, {"results": results})
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    quiet = False
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    quiet = False
+
+
+def make_server(
+    service: Service,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix: str | None = None,
+    quiet: bool = False,
+):
+    if unix is None:
+        server = HTTPServer((host, port), Handler)
+    else:
+        # A socket left behind by a previous run is replaced, other files not
+        with contextlib.suppress(FileNotFoundError):
+            if stat.S_ISSOCK(os.stat(unix).st_mode):
+                os.unlink(unix)
+        server = UnixHTTPServer(unix, Handler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def run(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="pybsqr serve",
+        description="Local HTTP server generating BySquare codes and images",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", metavar="PATH", help="Listen on a Unix socket")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Number of workers"
+    )
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="Requests admitted at once, running or queued (default 4 per worker)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=1.0,
+        help="Seconds a request waits for admission before it gets a 503",
+    )
+    parser.add_argument(
+        "--max-body", type=int, default=Handler.max_body, help="Request size limit"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="Cache codes and images in memory"
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="No request log")
+    args = parser.parse_args(argv)
+
+    Handler.max_body = args.max_body
+    service = Service(
+        jobs=args.jobs,
+        executor=args.executor,
+        max_pending=args.max_pending,
+        queue_timeout=args.queue_timeout,
+        cache=args.cache,
+    )
+    try:
+        service.start()
+        server = make_server(service, args.host, args.port, args.unix, args.quiet)
+        address = args.unix or f"http://{args.host}:{server.server_address[1]}"
+        print(f"Serving on {address} with {service.jobs} workers", file=sys.stderr)
+        with server:
+            with contextlib.suppress(KeyboardInterrupt):
+                server.serve_forever()
+    finally:
+        service.close()
+        if args.unix:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(args.unix)
@@ -0,0 +1,68 @@
+import os
+from typing import IO, Iterable, Iterator, NamedTuple
+
+from lxml import etree
+
+from .base import BySquare
+from .batch import BatchResult, generate_codes
+from .xml import get_generator
+
+
+DOCUMENT_TAGS = ("{*}Pay", "{*}Invoice")
+
+
+class StreamResult(NamedTuple):
+    index: int
+    generator: BySquare | None
+    error: str | None = None
+
+
+def documents(source: str | os.PathLike | IO) -> Iterator[bytes]:
+    # Serializes every Pay and Invoice element of a possibly huge XML file,
+    # dropping each one, and everything parsed before it, once it was handed
+    # out, so memory use does not grow with the file
+    for _, element in etree.iterparse(
+        source, events=("end",), tag=DOCUMENT_TAGS, remove_blank_text=True
+    ):
+        document = etree.tostring(element)
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+        yield document
+
+
+def iter_generators(source: str | os.PathLike | IO) -> Iterator[StreamResult]:
+    # Every document is validated against the schema on its own, exactly as
+    # get_generator does, and failures are reported per document
+    for index, document in enumerate(documents(source)):
+        try:
+            generator = get_generator(document)
+        except Exception as e:
+            yield StreamResult(index, None, f"{type(e).__name__}: {e}")
+        else:
+            yield StreamResult(index, generator)
+
+
+def iter_codes(
+    source: str | os.PathLike | IO,
+    *,
+    jobs: int | None = None,
+    executor: str = "process",
+    chunksize: int = 64,
+    max_version: int | None = None,
+    fit: str = "reject",
+    truncate: Iterable[str] | None = None,
+) -> Iterator[BatchResult]:
+    # Documents are read lazily as the bounded batch window advances, so
+    # parallel processing keeps memory flat as well
+    return generate_codes(
+        documents(source),
+        jobs=jobs,
+        executor=executor,
+        chunksize=chunksize,
+        max_version=max_version,
+        fit=fit,
+        truncate=truncate,
+    )
@@ -0,0 +1,187 @@
+import os
+import pathlib
+import threading
+from typing import Iterable, Iterator, NamedTuple
+
+from lxml import etree
+
+from . import checks, layout
+from .batch import map_chunks
+from .xml import SCHEMA_PATH
+
+
+# The schema collapses whitespace around dates and numbers and allows time
+# zones in dates, neither of which codes can carry, so the checks the
+# builders use apply as well
+CHECKS = {
+    "date": (checks.check_date, "must be a date as YYYY-MM-DD"),
+    "decimal": (checks.check_decimal, "must be a decimal without whitespace"),
+    "integer": (checks.check_integer, "must be an integer without whitespace"),
+    "percentage": (checks.check_percentage, "must be a percentage without whitespace"),
+}
+LAYOUTS = dict(layout.LAYOUTS.values())
+
+_local = threading.local()
+
+
+class Issue(NamedTuple):
+    path: str
+    message: str
+    line: int | None = None
+
+
+class Report(NamedTuple):
+    index: int
+    kind: str | None
+    issues: list[Issue]
+
+    @property
+    def valid(self) -> bool:
+        return not self.issues
+
+
+def _schema() -> etree.XMLSchema:
+    # A schema keeps the errors of its last validation, so unlike the parsers
+    # in xml.py every thread needs a schema of its own
+    schema = getattr(_local, "schema", None)
+    if schema is None:
+        schema = _local.schema = etree.XMLSchema(file=str(SCHEMA_PATH))
+    return schema
+
+
+def _path(element) -> str:
+    parts = []
+    while element is not None:
+        part = etree.QName(element).localname
+        parent = element.getparent()
+        if parent is not None:
+            siblings = parent.findall(element.tag)
+            if len(siblings) > 1:
+                part += f"[{siblings.index(element) + 1}]"
+        parts.append(part)
+        element = parent
+    return "/" + "/".join(reversed(parts))
+
+
+def _issue(element, message: str) -> Issue:
+    return Issue(_path(element), message, element.sourceline)
+
+
+def _check_layout(items: tuple, element, issues: list):
+    # Rules xml_to_fields relies on that the schema cannot express
+    children = {}
+    for child in element.iterchildren():
+        children.setdefault(child.tag, child)
+    for item in items:
+        child = children.get(f"{{{layout.NS}}}{item.tag}")
+        if child is None:
+            continue
+        if isinstance(item, layout.Field):
+            text = child.text or ""
+            values = text.split() if item.flags is not None else text
+            if item.required and not values:
+                issues.append(_issue(child, "must not be empty"))
+            if "\t" in text:
+                issues.append(_issue(child, "must not contain tabs"))
+            kind = "date" if item.date else item.number
+            if text and kind is not None:
+                check, message = CHECKS[kind]
+                try:
+                    check(item.tag, text)
+                except checks.ValidationError:
+                    issues.append(_issue(child, message))
+        elif isinstance(item, layout.Repeated):
+            for element in child.iterchildren(f"{{{layout.NS}}}{item.item}"):
+                _check_layout(item.layout, element, issues)
+        else:
+            _check_layout(item.layout, child, issues)
+
+
+def _check_payment(payment, issues: list):
+    options = payment.findtext(f"{{{layout.NS}}}PaymentOptions", "").split()
+    for option, tag in (
+        ("standingorder", "StandingOrderExt"),
+        ("directdebit", "DirectDebitExt"),
+    ):
+        # The options do not require their extension while codes cannot
+        # carry it, the builders leave it out as well
+        extension = payment.find(f"{{{layout.NS}}}{tag}")
+        if extension is None:
+            continue
+        if option not in options:
+            issues.append(_issue(extension, f"is only given with {option}"))
+        issues.append(_issue(extension, "is not encoded into codes yet"))
+
+
+def _check_invoice(invoice, issues: list):
+    lines = invoice.find(f"{{{layout.NS}}}NumberOfInvoiceLines")
+    if lines is None:
+        return
+    if int(lines.text) == 1:
+        issues.append(_issue(lines, "must be left out in favour of SingleInvoiceLine"))
+    description = invoice.find(f"{{{layout.NS}}}InvoiceDescription")
+    if description is not None and description.text and int(lines.text) < 2:
+        issues.append(_issue(description, "is only given for several invoice lines"))
+
+
+def validate_document(xml: str | bytes) -> tuple[str | None, list[Issue]]:
+    # Checks a Pay or Invoice document against the schema and, once that
+    # passes, against the rules of the code layout, without encoding it
+    try:
+        root = etree.fromstring(xml)
+    except etree.XMLSyntaxError as e:
+        return None, [Issue("", str(e), e.lineno)]
+    kind = etree.QName(root).localname
+    schema = _schema()
+    if not schema.validate(root):
+        tree = root.getroottree()
+        issues = []
+        for error in schema.error_log:
+            found = tree.xpath(error.path) if error.path else []
+            issues.append(
+                Issue(
+                    _path(found[0]) if found else error.path or "",
+                    error.message.replace(f"{{{layout.NS}}}", ""),
+                    error.line,
+                )
+            )
+        return kind, issues
+    if kind not in LAYOUTS:
+        # The schema has other global elements, like InvoiceItems
+        return kind, [_issue(root, f"unsupported document type {kind}")]
+    issues = []
+    _check_layout(LAYOUTS[kind], root, issues)
+    if kind == "Pay":
+        for payment in root.iter(f"{{{layout.NS}}}Payment"):
+            _check_payment(payment, issues)
+    else:
+        _check_invoice(root, issues)
+    return kind, issues
+
+
+def _validate_chunk(chunk: list) -> list[Report]:
+    reports = []
+    for index, item in chunk:
+        try:
+            if isinstance(item, os.PathLike):
+                item = pathlib.Path(item).read_bytes()
+            if not isinstance(item, (str, bytes)):
+                raise TypeError("Only XML documents can be validated")
+            reports.append(Report(index, *validate_document(item)))
+        except Exception as e:
+            reports.append(Report(index, None, [Issue("", f"{type(e).__name__}: {e}")]))
+    return reports
+
+
+def validate_documents(
+    items: Iterable,
+    *,
+    jobs: int | None = None,
+    executor: str = "process",
+    chunksize: int = 64,
+) -> Iterator[Report]:
+    # Items are XML documents (str or bytes) or paths of XML files, reported
+    # on in input order
+    return map_chunks(
+        _validate_chunk, items, jobs=jobs, executor=executor, chunksize=chunksize
+    )
@@ -1,22 +1,45 @@
-import pathlib
+import os
+import threading
 
 from lxml import etree, objectify
 
+from . import aio
+from .instrument import instrumented
 from .invoice import InvoiceBySquare
 from .pay import PayBySquare
 
 
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "bysquare.xsd")
+
+_schema = None
+_schema_lock = threading.Lock()
+_local = threading.local()
+
+
 def load_schema() -> etree.XMLSchema:
-    schema_path = pathlib.Path(__file__).parent / "bysquare.xsd"
-    with open(schema_path, "r") as f:
-        return etree.XMLSchema(file=f)
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                with open(SCHEMA_PATH, "r") as f:
+                    _schema = etree.XMLSchema(file=f)
+    return _schema
 
 
 def makeparser():
-    schema = load_schema()
-    return objectify.makeparser(schema=schema)
+    # lxml parsers must not be shared between threads, so every thread gets
+    # its own one built around the process-wide compiled schema
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = objectify.makeparser(schema=load_schema())
+    return parser
+
 
+def warmup():
+    makeparser()
 
+
+@instrumented("get_generator")
 def get_generator(xml):
     parser = makeparser()
     data = objectify.fromstring(xml, parser)
@@ -24,3 +47,7 @@ def get_generator(xml):
         return PayBySquare(data)
     elif data.tag.endswith("Invoice"):
         return InvoiceBySquare(data)
+
+
+async def aget_generator(xml):
+    return await aio.run(get_generator, xml)
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+from pybsqr import cache
+from pybsqr.bysquare import create_pay_by_square
+
+
+def _pay():
+    return create_pay_by_square(
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+    )
+
+
+@pytest.fixture
+def result_cache():
+    result_cache = cache.ResultCache()
+    cache.set_cache(result_cache)
+    yield result_cache
+    cache.set_cache(None)
+
+
+def test_agenerate_code_shares_cache(result_cache):
+    code = asyncio.run(_pay().agenerate_code())
+    assert len(result_cache) == 1
+    assert _pay().generate_code() == code
+    assert len(result_cache) == 1
+
+
+def test_agenerate_code_extracts_fields_off_the_loop(monkeypatch):
+    generator = _pay()
+    generator._fields = None
+    loop_thread = threading.get_ident()
+    threads = []
+    extract = type(generator).xml_to_fields
+
+    def xml_to_fields(self, xml=None):
+        threads.append(threading.get_ident())
+        return extract(self, xml)
+
+    monkeypatch.setattr(type(generator), "xml_to_fields", xml_to_fields)
+    code = asyncio.run(generator.agenerate_code())
+    assert threads and loop_thread not in threads
+    assert generator.fields == _pay().fields
+    assert code == _pay().generate_code()
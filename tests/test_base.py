@@ -0,0 +1,126 @@
+import io
+import zlib
+
+import pytest
+
+from pybsqr import base
+from pybsqr.bysquare import create_pay_by_square
+from pybsqr.qr import qr_matrix
+
+
+def _pay():
+    return create_pay_by_square(
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+    )
+
+
+def test_palette_frame_without_white(monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    # No white pixel at all, so the search for one finds nothing
+    frame = Image.new("RGBA", (4, 4), (0, 255, 255, 255))
+    monkeypatch.setattr(base, "_scaled_frame", lambda frame_name, width: frame)
+    img, black = base._palette_frame.__wrapped__("frame", 4, 3)
+    assert img.getpalette()[3 * black : 3 * black + 3] == [0, 0, 0]
+
+
+@pytest.mark.parametrize("format", ["PNG", "SVG"])
+def test_generate_qr_unknown_error_correction(format):
+    generator = _pay()
+    with pytest.raises(ValueError, match="Unsupported error correction 'Z'"):
+        generator.generate_qr(format=format, error_correction="Z")
+
+
+def test_qr_matrix_unknown_error_correction():
+    with pytest.raises(ValueError, match="Unsupported error correction 'Z'"):
+        qr_matrix("0004G", "Z")
+
+
+def _read_png(data: bytes) -> list[list[int]]:
+    # Pixels of a 1-bit grayscale PNG, decoded by hand
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    offset = 8
+    while offset < len(data):
+        length = int.from_bytes(data[offset : offset + 4], "big")
+        tag = data[offset + 4 : offset + 8]
+        body = data[offset + 8 : offset + 8 + length]
+        checksum = data[offset + 8 + length : offset + 12 + length]
+        assert zlib.crc32(tag + body).to_bytes(4, "big") == checksum
+        chunks[tag] = chunks.get(tag, b"") + body
+        offset += 12 + length
+    assert list(chunks) == [b"IHDR", b"IDAT", b"IEND"]
+    width = int.from_bytes(chunks[b"IHDR"][:4], "big")
+    height = int.from_bytes(chunks[b"IHDR"][4:8], "big")
+    assert chunks[b"IHDR"][8:] == bytes((1, 0, 0, 0, 0))
+    raw = zlib.decompress(chunks[b"IDAT"])
+    stride = (width + 7) // 8
+    assert len(raw) == height * (stride + 1)
+    pixels = []
+    previous = bytes(stride)
+    for y in range(height):
+        filter_type = raw[y * (stride + 1)]
+        row = raw[y * (stride + 1) + 1 : (y + 1) * (stride + 1)]
+        assert filter_type in (0, 2)
+        if filter_type == 2:
+            row = bytes((a + b) & 0xFF for a, b in zip(row, previous))
+        previous = row
+        value = int.from_bytes(row, "big") >> (stride * 8 - width)
+        pixels.append([int(bit) for bit in f"{value:0{width}b}"])
+    return pixels
+
+
+def _expected_pixels(matrix, box_size: int, border: int) -> list[list[int]]:
+    # Dark modules are black, which is 0 in grayscale
+    pixels = []
+    for row in matrix.rows(border):
+        line = [1 - module for module in row for _ in range(box_size)]
+        pixels.extend([line] * box_size)
+    return pixels
+
+
+@pytest.mark.parametrize(
+    "box_size, border", [(1, 0), (1, 4), (3, 1), (5, 2), (10, 4), (13, 3)]
+)
+@pytest.mark.parametrize("compress_level", [None, 0, 9])
+def test_plain_png_matches_module_matrix(box_size, border, compress_level):
+    generator = _pay()
+    png = generator.generate_qr(
+        frame=False, box_size=box_size, border=border, compress_level=compress_level
+    ).getvalue()
+    matrix = qr_matrix(generator.code, "M")
+    assert _read_png(png) == _expected_pixels(matrix, box_size, border)
+
+
+@pytest.mark.parametrize("size", [100, 257, 333])
+def test_plain_png_size_widens_quiet_zone(size):
+    generator = _pay()
+    png = generator.generate_qr(frame=False, size=size).getvalue()
+    matrix = qr_matrix(generator.code, "M")
+    box_size = size // (matrix.size + 8)
+    pixels = _read_png(png)
+    assert len(pixels) == size and all(len(row) == size for row in pixels)
+    before = (size - matrix.size * box_size) // 2
+    inside = range(before, before + matrix.size * box_size)
+    inner = [[row[x] for x in inside] for row in (pixels[y] for y in inside)]
+    assert inner == _expected_pixels(matrix, box_size, 0)
+    # Everything around the QR code is white
+    quiet = [
+        pixel
+        for y, row in enumerate(pixels)
+        for x, pixel in enumerate(row)
+        if y not in inside or x not in inside
+    ]
+    assert all(quiet)
+
+
+def test_plain_png_matches_pillow():
+    Image = pytest.importorskip("PIL.Image")
+    generator = _pay()
+    png = generator.generate_qr(frame=False, box_size=3, border=2).getvalue()
+    img = Image.open(io.BytesIO(png))
+    assert img.mode == "1"
+    pixels = [pixel // 255 for pixel in img.convert("L").tobytes()]
+    expected = _expected_pixels(qr_matrix(generator.code, "M"), 3, 2)
+    assert pixels == [pixel for row in expected for pixel in row]
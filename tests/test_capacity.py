@@ -0,0 +1,57 @@
+import random
+import string
+
+import pytest
+
+from pybsqr.batch import generate_codes
+from pybsqr.bysquare import create_pay_by_square
+from pybsqr.capacity import CodeTooLongError, code_size, fit_fields
+
+
+def _pay(**kwargs):
+    # Random text compresses badly, so the code outgrows QR version 40
+    note = "".join(random.Random(0).choices(string.ascii_letters, k=3000))
+    return {
+        "amount": "12.50",
+        "payment_due_date": "2024-05-01",
+        "bank_account_iban": "SK3112000000198742637541",
+        "payment_note": note,
+        **kwargs,
+    }
+
+
+def test_code_size_beyond_version_40():
+    generator = create_pay_by_square(**_pay())
+    size = code_size(generator.fields, generator.bysquare_type)
+    assert size.version is None
+
+
+def test_fit_fields_beyond_version_40():
+    generator = create_pay_by_square(**_pay(invoice_number="INV-2024-001"))
+    fields = generator.fields
+    with pytest.raises(CodeTooLongError):
+        fit_fields(fields, generator.bysquare_type, 10, strategy="reject")
+    fitted = fit_fields(fields, generator.bysquare_type, 10)
+    assert code_size(fitted, generator.bysquare_type).version <= 10
+    # Only free text is shortened by default, never the invoice number
+    assert fitted[0] == "INV-2024-001"
+    assert fitted[fields.index(_pay()["payment_note"])] != _pay()["payment_note"]
+
+
+def test_fit_fields_truncate_restricts_fields():
+    generator = create_pay_by_square(**_pay())
+    with pytest.raises(CodeTooLongError):
+        fit_fields(
+            generator.fields, generator.bysquare_type, 10, truncate=["InvoiceID"]
+        )
+
+
+@pytest.mark.parametrize("fit", ["reject", "truncate"])
+def test_generate_codes_beyond_version_40(fit):
+    [result] = generate_codes(
+        [_pay()], kind="pay", executor="serial", max_version=10, fit=fit
+    )
+    if fit == "reject":
+        assert result.error.startswith("CodeTooLongError")
+    else:
+        assert result.error is None
@@ -0,0 +1,34 @@
+import pytest
+
+from pybsqr.bysquare import create_pay_by_square
+from pybsqr.checks import ValidationError, check_date, check_decimal, check_integer
+
+
+@pytest.mark.parametrize(
+    "check, value",
+    [
+        (check_date, " 2024-05-01"),
+        (check_date, "2024-05-01 "),
+        (check_decimal, " 12.50"),
+        (check_integer, "3 "),
+    ],
+)
+def test_checks_reject_surrounding_whitespace(check, value):
+    with pytest.raises(ValidationError):
+        check("Element", value)
+
+
+def test_builder_rejects_padded_date():
+    with pytest.raises(ValidationError):
+        create_pay_by_square(
+            amount="12.50",
+            payment_due_date=" 2024-05-01",
+            bank_account_iban="SK3112000000198742637541",
+        )
+
+
+@pytest.mark.parametrize("value", ["2024-05-01Z", "2024-05-01+02:00"])
+def test_check_date_rejects_time_zones(value):
+    # Codes carry dates as YYYYMMDD, which has no room for a time zone
+    with pytest.raises(ValidationError):
+        check_date("Element", value)
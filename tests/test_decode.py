@@ -0,0 +1,142 @@
+import base64
+import binascii
+import lzma
+
+import pytest
+
+from pybsqr.bysquare import create_invoice_by_square, create_pay_by_square
+from pybsqr.decode import (
+    _LZMA_FILTERS,
+    DecodeError,
+    decode,
+    decode_code,
+    decode_codes,
+)
+from pybsqr.invoice import InvoiceBySquare
+from pybsqr.pay import PayBySquare
+
+
+def _pay():
+    return create_pay_by_square(
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+        bank_account_bic="TATRSKBX",
+        variable_symbol="2024001",
+        payment_note="Faktúra 2024001",
+        beneficiary_name="Dodávateľ s.r.o.",
+    )
+
+
+def _invoice():
+    return create_invoice_by_square(
+        invoice_number="F2024001",
+        issue_date="2024-05-01",
+        tax_date="2024-04-30",
+        supplier_name="Dodávateľ s.r.o.",
+        supplier_ico="12345678",
+        supplier_street="Hlavná",
+        supplier_street_number="1",
+        supplier_city="Bratislava",
+        supplier_zip="81101",
+        supplier_contact_email="fakturacia@example.sk",
+        customer_name="Odberateľ a.s.",
+        invoice_item_count=3,
+        invoice_description="Služby za apríl",
+        tax_summaries=[
+            dict(tax_category="0.2", price_ex_vat="100.00", vat_amount="20.00"),
+            dict(tax_category="0.1", price_ex_vat="50.00", vat_amount="5.00"),
+        ],
+    )
+
+
+def _code(type_: int, payload: bytes, checksum: bytes | None = None, length=None):
+    # Encodes a payload like generate_code, with the checksum and declared
+    # length open to tampering
+    if checksum is None:
+        checksum = binascii.crc32(payload).to_bytes(4, "little")
+    data = checksum + payload
+    compressed = lzma.compress(data, lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    if length is None:
+        length = len(data)
+    header = bytes((type_, 0x00)) + length.to_bytes(2, "little")
+    return base64.b32hexencode(header + compressed).decode().strip("=")
+
+
+@pytest.mark.parametrize(
+    "builder, generator", [(_pay, PayBySquare), (_invoice, InvoiceBySquare)]
+)
+def test_round_trip(builder, generator):
+    created = builder()
+    code = created.generate_code()
+    assert decode_code(code) == (created.bysquare_type, created.fields)
+
+    decoded = decode(code)
+    assert type(decoded) is generator
+    assert decoded.fields == created.fields
+    assert decoded.code == code
+    # Through the rebuilt XML document as well
+    assert decoded.xml_to_fields() == created.fields
+    assert decoded.generate_code() == code
+
+
+def test_hand_encoded_code():
+    fields = _pay().fields
+    code = _code(0x00, "\t".join(fields).encode())
+    assert decode_code(code) == (0x00, fields)
+
+
+def test_lowercase_and_whitespace():
+    code = _pay().generate_code()
+    assert decode_code(f" {code.lower()}\n") == decode_code(code)
+
+
+def test_bad_checksum():
+    payload = "\t".join(_pay().fields).encode()
+    code = _code(0x00, payload, checksum=bytes(4))
+    with pytest.raises(DecodeError, match="Checksum mismatch"):
+        decode_code(code)
+
+
+@pytest.mark.parametrize(
+    "code, message",
+    [
+        ("0004", "too short"),
+        ("0004G!", "not valid base32hex"),
+        (_code(0x30, b"x"), "Unsupported bysquare type 3"),
+        (_code(0xF0, b"x"), "Unsupported bysquare type 15"),
+    ],
+)
+def test_bad_header(code, message):
+    with pytest.raises(DecodeError, match=message):
+        decode_code(code)
+
+
+def test_declared_length_too_long():
+    payload = "\t".join(_pay().fields).encode()
+    code = _code(0x00, payload, length=len(payload) + 100)
+    with pytest.raises(DecodeError, match="header declares"):
+        decode_code(code)
+
+
+def test_declared_length_too_short():
+    # The payload is cut at the declared length, so the checksum fails
+    payload = "\t".join(_pay().fields).encode()
+    code = _code(0x00, payload, length=len(payload))
+    with pytest.raises(DecodeError, match="Checksum mismatch"):
+        decode_code(code)
+
+
+def test_truncated_code():
+    code = _pay().generate_code()
+    with pytest.raises(DecodeError):
+        decode_code(code[: len(code) // 2])
+
+
+def test_decode_codes_reports_errors_in_order():
+    codes = [_pay().generate_code(), "0004", _invoice().generate_code()]
+    results = list(decode_codes(codes, executor="serial"))
+    assert [result.index for result in results] == [0, 1, 2]
+    assert results[0].fields == _pay().fields
+    assert results[1].fields is None and results[1].error.startswith("DecodeError")
+    assert results[2].type_ == InvoiceBySquare.bysquare_type
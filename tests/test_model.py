@@ -0,0 +1,19 @@
+import pytest
+from lxml import etree
+
+from pybsqr.bysquare import create_pay_by_square
+
+
+model = pytest.importorskip("pybsqr.model")
+
+
+def test_from_data_without_kind():
+    generator = create_pay_by_square(
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+    )
+    data = model.Pay.from_xml(etree.tostring(generator.xml)).model_dump_json()
+    document = model.from_data(None, data)
+    assert isinstance(document, model.Pay)
+    assert document.to_fields() == generator.fields
@@ -0,0 +1,36 @@
+from pybsqr.bysquare import create_invoice_by_square, create_pay_by_square
+from pybsqr.records import BankAccount, Pay, from_generator
+
+
+def test_records_deduplicate():
+    pay = create_pay_by_square(
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+    )
+    invoice = create_invoice_by_square(
+        invoice_number="F1",
+        issue_date="2024-05-01",
+        tax_date="2024-05-01",
+        supplier_name="Sup",
+        supplier_street="Main",
+        supplier_city="BA",
+        supplier_zip="81101",
+        customer_name="Cust",
+        invoice_item_count=1,
+        invoice_item_text="Thing",
+        tax_summaries=[dict(tax_category="0.2", price_ex_vat="10", vat_amount="2")],
+    )
+    records = [from_generator(g) for g in (pay, invoice, pay, invoice)]
+    assert len(set(records)) == 2
+    assert {records[0]: "pay"}[from_generator(pay)] == "pay"
+
+
+def test_record_hash_follows_equality():
+    def account():
+        return BankAccount("SK3112000000198742637541", "")
+
+    assert Pay("1", (account(),)) == Pay("1", (account(),))
+    assert hash(Pay("1", (account(),))) == hash(Pay("1", (account(),)))
+    # Repeated items assigned as a list are hashable as well
+    assert hash(Pay("1", [account()]))
@@ -0,0 +1,33 @@
+import threading
+
+from pybsqr.server import Service
+
+
+def test_codes_bounds_chunks_in_flight():
+    service = Service(jobs=2, executor="thread", chunksize=1)
+    submit = service.pool.submit
+    lock = threading.Lock()
+    running = peak = 0
+
+    def track(future):
+        nonlocal running
+        with lock:
+            running -= 1
+
+    def tracked_submit(*args):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        future = submit(*args)
+        future.add_done_callback(track)
+        return future
+
+    service.pool.submit = tracked_submit
+    try:
+        items = list(enumerate([{"xml": "<x/>"}] * 20))
+        results = service.codes(items)
+    finally:
+        service.close()
+    assert [result.index for result in results] == list(range(20))
+    assert peak <= service.jobs + 1
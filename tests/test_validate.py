@@ -0,0 +1,83 @@
+import pytest
+from lxml import etree
+
+from pybsqr import layout
+from pybsqr.bysquare import create_invoice_by_square, create_pay_by_square
+from pybsqr.validate import validate_document
+
+
+INVOICE_ITEMS = b"""<InvoiceItems xmlns="http://www.bysquare.com/bysquare"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:type="InvoiceItems">
+  <InvoiceID>F1</InvoiceID>
+  <FirstInvoiceLineID>1</FirstInvoiceLineID>
+  <InvoiceLines>
+    <InvoiceLine>
+      <ItemName>Thing</ItemName>
+      <InvoicedQuantity>1</InvoicedQuantity>
+      <UnitPriceTaxExclusiveAmount>10</UnitPriceTaxExclusiveAmount>
+      <UnitPriceTaxAmount>2</UnitPriceTaxAmount>
+      <ClassifiedTaxCategory>0.2</ClassifiedTaxCategory>
+    </InvoiceLine>
+  </InvoiceLines>
+</InvoiceItems>"""
+
+
+def test_unsupported_document_type():
+    kind, issues = validate_document(INVOICE_ITEMS)
+    assert kind == "InvoiceItems"
+    assert [issue.message for issue in issues] == [
+        "unsupported document type InvoiceItems"
+    ]
+
+
+def _invoice_xml(lines: int = 3) -> bytes:
+    generator = create_invoice_by_square(
+        invoice_number="F1",
+        issue_date="2024-05-01",
+        tax_date="2024-05-01",
+        supplier_name="Sup",
+        supplier_street="Main",
+        supplier_city="BA",
+        supplier_zip="81101",
+        customer_name="Cust",
+        invoice_item_count=lines,
+        invoice_description="Things",
+        tax_summaries=[dict(tax_category="0.2", price_ex_vat="10", vat_amount="2")],
+    )
+    return etree.tostring(generator.xml)
+
+
+def _replace(xml: bytes, tag: str, value: str) -> bytes:
+    root = etree.fromstring(xml)
+    root.find(f".//{{{layout.NS}}}{tag}").text = value
+    return etree.tostring(root)
+
+
+def test_builder_output_is_valid():
+    assert validate_document(_invoice_xml()) == ("Invoice", [])
+
+
+@pytest.mark.parametrize(
+    "tag, value",
+    [
+        ("NumberOfInvoiceLines", " 3 "),
+        ("TaxExclusiveAmount", "10 "),
+        ("ClassifiedTaxCategory", " 0.2"),
+        ("IssueDate", " 2024-05-01"),
+        ("IssueDate", "2024-05-01Z"),
+    ],
+)
+def test_whitespace_and_time_zones_rejected_like_builders(tag, value):
+    kind, issues = validate_document(_replace(_invoice_xml(), tag, value))
+    assert [issue.path.rsplit("/", 1)[-1] for issue in issues] == [tag]
+
+
+@pytest.mark.parametrize("payment_types", [["standingorder"], ["directdebit"]])
+def test_builder_output_without_extension_is_valid(payment_types):
+    generator = create_pay_by_square(
+        payment_types=payment_types,
+        amount="12.50",
+        payment_due_date="2024-05-01",
+        bank_account_iban="SK3112000000198742637541",
+    )
+    assert validate_document(etree.tostring(generator.xml)) == ("Pay", [])